@@ -1,122 +1,271 @@
-from fastapi import FastAPI, Query, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
 import pandas as pd
 import os
 from dotenv import load_dotenv
 from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from functools import wraps
+from pathlib import Path
+import asyncio
 import io
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.ingest_version import ensure_ingestion_version, read_ingestion_version_async
+from common.latest import ensure_latest
+from common.rollups import ensure_rollups
+from common.schema import ensure_schema
 
 load_dotenv()
-app = FastAPI()
+# Engine đồng bộ chỉ dùng lúc khởi động để tạo schema; các endpoint đọc qua async_engine
 engine = create_engine(os.getenv("DATABASE_URL"))
+
+# Pool kết nối asyncpg cho các endpoint
+DB_POOL_SIZE = int(os.getenv("API_DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("API_DB_MAX_OVERFLOW", "10"))
+# Thời gian tối đa chờ lấy kết nối từ pool trước khi trả 503
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("API_DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("API_DB_POOL_RECYCLE_SECONDS", "1800"))
+# Số prepared statement giữ lại trên mỗi kết nối
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("API_DB_STATEMENT_CACHE_SIZE", "100"))
+# statement_timeout của các endpoint dashboard, và của các endpoint đọc cả lịch sử (/time-series, /table)
+QUERY_TIMEOUT_SECONDS = float(os.getenv("API_QUERY_TIMEOUT_SECONDS", "5"))
+EXPORT_QUERY_TIMEOUT_SECONDS = float(os.getenv("API_EXPORT_QUERY_TIMEOUT_SECONDS", "30"))
+QUERY_CANCELED = '57014'
+
+
+def async_database_url(url: str):
+    # Cùng DATABASE_URL, chỉ đổi driver sang asyncpg
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+async_engine = create_async_engine(
+    async_database_url(os.getenv("DATABASE_URL")),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=True,
+    connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+)
+
+
+async def read_frame(query: str, params: dict = None, timeout: float = QUERY_TIMEOUT_SECONDS) -> pd.DataFrame:
+    try:
+        async with async_engine.connect() as conn:
+            # Hủy câu truy vấn ở phía server khi quá hạn, kết nối vẫn trả về pool dùng tiếp được
+            await conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout * 1000)}"))
+            result = await conn.execute(text(query), params or {})
+            rows = result.fetchall()
+    except PoolTimeoutError:
+        raise HTTPException(status_code=503, detail="No database connection available")
+    except DBAPIError as e:
+        if getattr(e.orig, "sqlstate", None) == QUERY_CANCELED:
+            raise HTTPException(status_code=504, detail=f"Query took longer than {timeout:g} s")
+        raise
+    return pd.DataFrame.from_records(rows, columns=list(result.keys()), coerce_float=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bảng và index phục vụ các truy vấn bên dưới
+    ensure_schema(engine)
+    # Bảng rollup, LatestAirQuality (dựng từ AirQualityRecord nếu DB đã có dữ liệu) và
+    # IngestionVersion, để các endpoint chạy được trước lượt load đầu tiên của cleaner
+    ensure_rollups(engine)
+    ensure_latest(engine)
+    ensure_ingestion_version(engine)
+    yield
+    await async_engine.dispose()
+    engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 
+# Kết quả dashboard được giữ trong bộ nhớ đến khi cleaner load lô mới (IngestionVersion đổi) hoặc hết TTL
+CACHE_TTL_SECONDS = float(os.getenv("API_CACHE_TTL_SECONDS", "3600"))
+# Khoảng thời gian tối thiểu giữa hai lần đọc IngestionVersion
+CACHE_VERSION_CHECK_SECONDS = float(os.getenv("API_CACHE_VERSION_CHECK_SECONDS", "5"))
+
+
+class ResultCache:
+    def __init__(self, engine, ttl: float, version_check: float):
+        self.engine = engine
+        self.ttl = ttl
+        self.version_check = version_check
+        self._entries = {}
+        self._key_locks = {}
+        self._version = None
+        self._checked_at = None
+
+    async def version(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.version_check:
+            version = await read_ingestion_version_async(self.engine)
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._checked_at = now
+        return self._version
+
+    def _fresh(self, key, version):
+        entry = self._entries.get(key)
+        if entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+            return entry
+        return None
+
+    async def get_or_compute(self, key, compute):
+        version = await self.version()
+        entry = self._fresh(key, version)
+        if entry:
+            return entry[2]
+        # Một request tính lại, các request trùng lúc chờ rồi dùng chung kết quả
+        async with self._key_locks.setdefault(key, asyncio.Lock()):
+            entry = self._fresh(key, version)
+            if entry:
+                return entry[2]
+            value = await compute()
+            if version == self._version:
+                self._entries[key] = (version, time.monotonic(), value)
+            return value
+
+
+RESULTS = ResultCache(async_engine, CACHE_TTL_SECONDS, CACHE_VERSION_CHECK_SECONDS)
+
+
+def cached(func):
+    @wraps(func)
+    async def wrapper():
+        return await RESULTS.get_or_compute(func.__name__, func)
+    return wrapper
+
+
+# Bản ghi mới nhất của mỗi thành phố (qua mọi nguồn), từ bảng LatestAirQuality do cleaner cập nhật
+LATEST_PER_CITY = '''
+    SELECT DISTINCT ON (city_id) * FROM "LatestAirQuality"
+    ORDER BY city_id, timestamp DESC, source_id
+'''
+
+def latest_kpis(df: pd.DataFrame) -> dict:
+    # Chưa có bản ghi nào (DB mới) thì trả None thay vì NaN / lỗi idxmax
+    has_aqi = df['aqi'].notna().any()
+    return {
+        "avg_aqi": float(round(df['aqi'].mean(), 1)) if has_aqi else None,
+        "avg_pm25": float(round(df['pm25'].mean(), 1)) if df['pm25'].notna().any() else None,
+        "top_city": str(df.loc[df['aqi'].idxmax(), 'city_id']) if has_aqi else None,
+    }
+
+@cached
+async def dashboard_context():
+    df = await read_frame(f"""
+        SELECT * FROM ({LATEST_PER_CITY}) l
+        ORDER BY timestamp DESC
+    """)
+
+    return {"df": df.to_dict(orient="records"), **latest_kpis(df)}
+
 @app.get("/")
-def dashboard(request: Request):
-    with engine.connect() as conn:
-        result = conn.execute(text("""
-            SELECT * FROM "AirQualityRecord"
-            ORDER BY timestamp DESC
-            LIMIT 100
-        """))
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
-
-    avg_aqi = float(round(df['aqi'].mean(), 1))
-    avg_pm25 = float(round(df['pm25'].mean(), 1))
-    top_city = str(df.loc[df['aqi'].idxmax(), 'city_id'])
-
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "df": df.to_dict(orient="records"),
-        "avg_aqi": avg_aqi,
-        "avg_pm25": avg_pm25,
-        "top_city": top_city
-    })
+async def dashboard(request: Request):
+    return templates.TemplateResponse("dashboard.html", {"request": request, **await dashboard_context()})
 
 @app.get("/air-quality")
-def get_latest_air_quality():
+@cached
+async def get_latest_air_quality():
     query = 'SELECT * FROM "AirQualityRecord" ORDER BY timestamp DESC LIMIT 100'
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query)
     return df.to_dict(orient="records")
 
 @app.get("/kpi-summary")
-def kpi_summary():
-    query = 'SELECT aqi, pm25, city_id FROM "AirQualityRecord" ORDER BY timestamp DESC LIMIT 100'
-    df = pd.read_sql(query, engine)
-    return {
-        "avg_aqi": float(round(df['aqi'].mean(), 1)),
-        "avg_pm25": float(round(df['pm25'].mean(), 1)),
-        "top_city_id": str(df.loc[df['aqi'].idxmax(), 'city_id'])
-    }
+@cached
+async def kpi_summary():
+    query = f'SELECT aqi, pm25, city_id FROM ({LATEST_PER_CITY}) l'
+    kpis = latest_kpis(await read_frame(query))
+    return {"avg_aqi": kpis["avg_aqi"], "avg_pm25": kpis["avg_pm25"], "top_city_id": kpis["top_city"]}
 
 @app.get("/cities")
-def get_cities():
+@cached
+async def get_cities():
     query = 'SELECT DISTINCT city_id FROM "AirQualityRecord"'
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query)
     return df['city_id'].tolist()
 
 @app.get("/province-summary")
-def get_province_summary():
+@cached
+async def get_province_summary():
     query = '''
-        SELECT c.province, AVG(a.aqi) as avg_aqi
-        FROM "AirQualityRecord" a
-        JOIN "City" c ON a.city_id = c.city_id
+        SELECT c.province, SUM(d.aqi_sum) / NULLIF(SUM(d.aqi_count), 0) as avg_aqi
+        FROM "AirQualityDaily" d
+        JOIN "City" c ON d.city_id = c.city_id
         GROUP BY c.province
         ORDER BY avg_aqi DESC
     '''
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query)
     return df.to_dict(orient="records")
 
 @app.get("/time-series")
-def time_series(city_id: int = Query(...)):
-    query = f'''
+async def time_series(city_id: int = Query(...)):
+    query = '''
         SELECT timestamp, aqi
         FROM "AirQualityRecord"
-        WHERE city_id = {city_id}
+        WHERE city_id = :city_id
         ORDER BY timestamp ASC
     '''
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query, {"city_id": city_id}, timeout=EXPORT_QUERY_TIMEOUT_SECONDS)
     df['timestamp'] = df['timestamp'].astype(str)
     return df.to_dict(orient="records")
 
 @app.get("/map-data")
-def get_map_data():
-    query = '''
+@cached
+async def get_map_data():
+    query = f'''
         SELECT aqi, c.city_name, c.latitude, c.longitude
-        FROM "AirQualityRecord" a
-        JOIN "City" c ON a.city_id = c.city_id
+        FROM ({LATEST_PER_CITY}) l
+        JOIN "City" c ON l.city_id = c.city_id
         ORDER BY timestamp DESC
-        LIMIT 200
     '''
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query)
     return df.to_dict(orient="records")
 
 @app.get("/source-breakdown")
-def get_source_summary():
+@cached
+async def get_source_summary():
     query = '''
-        SELECT s.source_name, COUNT(*) as total
-        FROM "AirQualityRecord" a
-        JOIN "Source" s ON a.source_id = s.source_id
+        SELECT s.source_name, CAST(SUM(d.record_count) AS BIGINT) as total
+        FROM "AirQualityDaily" d
+        JOIN "Source" s ON d.source_id = s.source_id
         GROUP BY s.source_name
     '''
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query)
     return df.to_dict(orient="records")
 
 @app.get("/filter")
-def filter_data(
+async def filter_data(
     city_id: int = Query(None),
     source_id: int = Query(None),
     start_time: str = Query(None),
     end_time: str = Query(None)
 ):
-    filters = []
+    # Tham số bind thay vì ghép chuỗi, để prepared statement được dùng lại giữa các request
+    filters, params = [], {}
     if city_id:
-        filters.append(f"city_id = {city_id}")
+        filters.append("city_id = :city_id")
+        params["city_id"] = city_id
     if source_id:
-        filters.append(f"source_id = {source_id}")
+        filters.append("source_id = :source_id")
+        params["source_id"] = source_id
     if start_time and end_time:
-        filters.append(f"timestamp BETWEEN '{start_time}' AND '{end_time}'")
+        try:
+            params["start_time"] = pd.Timestamp(start_time).to_pydatetime()
+            params["end_time"] = pd.Timestamp(end_time).to_pydatetime()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="start_time and end_time must be dates or timestamps")
+        filters.append("timestamp BETWEEN :start_time AND :end_time")
 
     filter_clause = " AND " .join(filters)
     if filter_clause:
@@ -124,47 +273,44 @@ def filter_data(
     else:
         query = 'SELECT * FROM "AirQualityRecord" ORDER BY timestamp DESC LIMIT 100'
 
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query, params)
     return df.to_dict(orient="records")
 
 @app.get("/table/{table_name}")
-def get_entire_table(table_name: str):
+async def get_entire_table(table_name: str):
     try:
         query = f'SELECT * FROM "{table_name}"'
-        df = pd.read_sql(query, engine)
+        df = await read_frame(query, timeout=EXPORT_QUERY_TIMEOUT_SECONDS)
         return df.to_dict(orient="records")
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/realtime-tab")
-def realtime_tab():
+async def realtime_tab():
     query = '''
         SELECT * FROM "AirQualityRecord"
         WHERE timestamp >= NOW() - INTERVAL '1 hour'
         ORDER BY timestamp DESC
     '''
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query)
     return df.to_dict(orient="records")
 
 @app.get("/calculation-tab")
-def calculation_tab():
+@cached
+async def calculation_tab():
     query = '''
-        SELECT city_id, date_trunc('day', timestamp) as day, AVG(aqi) as avg_aqi, MAX(aqi) as max_aqi
-        FROM "AirQualityRecord"
-        GROUP BY city_id, day
+        SELECT city_id, bucket as day, SUM(aqi_sum) / NULLIF(SUM(aqi_count), 0) as avg_aqi, MAX(aqi_max) as max_aqi
+        FROM "AirQualityDaily"
+        GROUP BY city_id, bucket
         ORDER BY day DESC, city_id
         LIMIT 200
     '''
-    df = pd.read_sql(query, engine)
+    df = await read_frame(query)
     df['day'] = df['day'].astype(str)
     return df.to_dict(orient="records")
 
 @app.get("/latest-by-city")
-def latest_by_city():
-    query = """
-        SELECT DISTINCT ON (city_id) *
-        FROM "AirQualityRecord"
-        ORDER BY city_id, timestamp DESC
-    """
-    df = pd.read_sql(query, engine)
+@cached
+async def latest_by_city():
+    df = await read_frame(LATEST_PER_CITY)
     return df.to_dict(orient="records")
@@ -0,0 +1,115 @@
+"""
+Compare clean_data on a whole crawler export against the two-pass chunked cleaner
+(CleanStats + clean_data per chunk) on a synthetic CSV: peak traced memory, run time and
+how far the chunked output drifts from the in-memory one.
+
+Run from the repository root:
+    python benchmarks/bench_chunked_clean.py [--rows 1000000] [--chunk-rows 50000]
+
+Exits with an error if fill or per-city coordinate means differ beyond float rounding, or
+if a clip bound is off by more than the quantile sketch's relative accuracy.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# clean_data builds its SQLAlchemy engine at import time; no database is used here
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+from data_cleaner.clean_data import (  # noqa: E402
+    COORD_COLS, NUMERIC_COLS, QUANTILE_ACCURACY, clean_data, compute_clean_stats, iter_export_chunks,
+    mask_coordinates,
+)
+
+CONDITIONS = ['Clouds', 'clear', ' Rain', 'mist', None]
+
+
+def write_export(path: Path, rows: int, cities: int = 60, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    city_ids = rng.integers(0, cities, rows)
+    df = pd.DataFrame({
+        'timestamp': (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 86400 * 90, rows), unit='s'))
+        .strftime('%Y-%m-%d %H:%M:%S'),
+        'city': pd.Series([f"City {i}" for i in range(cities)]).take(city_ids).to_numpy(),
+        'province': pd.Series([f"Province {i % 20}" for i in range(cities)]).take(city_ids).to_numpy(),
+        'city_source': 'station',
+        'latitude': 8 + city_ids * 0.2 + rng.normal(0, 0.01, rows),
+        'longitude': 102 + city_ids * 0.1 + rng.normal(0, 0.01, rows),
+    })
+    for col in NUMERIC_COLS:
+        values = rng.lognormal(3, 1, rows).round(2)
+        values[rng.random(rows) < 0.05] = np.nan
+        values[rng.random(rows) < 0.01] *= -1
+        df[col] = values
+    df.loc[rng.random(rows) < 0.01, 'longitude'] = 999.0
+    df.loc[rng.random(rows) < 0.01, 'latitude'] = np.nan
+    df['weather_condition'] = rng.choice(np.array(CONDITIONS, dtype=object), rows)
+    df['source'] = rng.choice(['waqi', 'iqair', 'openweathermap'], rows)
+    df['status'] = 'success'
+    df.to_csv(path, index=False)
+
+
+def measured(label: str, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:10} {elapsed:8.2f} s  peak {peak / 2**20:8.1f} MiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--chunk-rows', type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'air_quality_vietnam_bench.csv'
+        write_export(path, args.rows)
+        print(f"{args.rows:,} rows, {path.stat().st_size / 2**20:.1f} MiB CSV, chunks of {args.chunk_rows:,}")
+
+        whole = measured('in-memory', lambda: clean_data(pd.read_csv(path)))
+
+        def chunked():
+            stats = compute_clean_stats(iter_export_chunks(path, args.chunk_rows))
+            rows = 0
+            for chunk in iter_export_chunks(path, args.chunk_rows):
+                rows += len(clean_data(chunk, stats))
+            return stats, rows
+        stats, rows = measured('chunked', chunked)
+        raw = pd.read_csv(path)
+
+    print(f"\nrows kept: in-memory {len(whole):,}, chunked {rows:,} (duplicates are only dropped per chunk)")
+    fill_values, upper_bounds = stats.fill_values(), stats.upper_bounds()
+    worst_bound = 0.0
+    for col in NUMERIC_COLS:
+        mean = raw[col].mean()
+        if not np.isclose(fill_values[col], mean, rtol=1e-12):
+            sys.exit(f"{col}: fill mean {fill_values[col]} vs {mean}")
+        expected = raw[col].fillna(mean).quantile(0.999)
+        drift = abs(upper_bounds[col] - expected) / expected
+        worst_bound = max(worst_bound, drift)
+        if drift > QUANTILE_ACCURACY:
+            sys.exit(f"{col}: clip bound {upper_bounds[col]} vs {expected} (relative error {drift:.2e})")
+
+    coords = mask_coordinates(raw[COORD_COLS].copy())
+    expected_coords = coords.groupby(raw['city'].str.lower().str.strip()).mean()
+    actual_coords = stats.city_coordinates().reindex(expected_coords.index)
+    if not np.allclose(actual_coords, expected_coords, rtol=1e-12):
+        sys.exit("per-city coordinate means differ")
+    print(f"fill and coordinate means match; clip bounds within {worst_bound:.1e} relative error "
+          f"(sketch accuracy {QUANTILE_ACCURACY})")
+
+
+if __name__ == '__main__':
+    main()
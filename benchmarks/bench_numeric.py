@@ -0,0 +1,95 @@
+"""
+Benchmark common.numeric against the crawler's original extract_number on a batch of
+scraped-style pollutant strings.
+
+Run from the repository root:
+    python benchmarks/bench_numeric.py [--rows 200000]
+
+Exits with an error if parse_number or parse_numbers disagree with the original
+implementation on any generated value, or if signed parsing (the cleaner's CSV columns)
+does not keep negative values as pd.to_numeric did.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.numeric import parse_number, parse_numbers  # noqa: E402
+
+TEMPLATES = ['{v}', ' {v} ', '{v} µg/m³', 'PM2.5: {v}', '{v}&nbsp;ppb', '{c}', '-', '', 'n/a']
+# Text the cleaner's signed parsing must read as pd.to_numeric would (plus units it could not)
+SIGNED_CASES = {'-3.5': -3.5, '-0,4': -0.4, '12': 12.0, '-': np.nan, '': np.nan, '-7 °C': -7.0}
+
+
+def legacy_extract_number(text):
+    """AirQualityCrawler.extract_number before the rewrite."""
+    if not text:
+        return None
+    text = str(text).strip()
+    text = re.sub(r'[^\d.,\-\s]', '', text)
+    text = text.replace(',', '.').strip()
+    for pattern in [r'(\d+\.?\d*)', r'(\d+)']:
+        matches = re.findall(pattern, text)
+        if matches:
+            try:
+                return float(matches[0])
+            except (ValueError, IndexError):
+                continue
+    return None
+
+
+def make_batch(rows: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    batch = []
+    for _ in range(rows):
+        value = round(rng.uniform(0, 500), rng.choice([0, 1, 2]))
+        batch.append(rng.choice(TEMPLATES).format(v=value, c=str(value).replace('.', ',')))
+    return batch
+
+
+def timed(label: str, func, rows: int):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:32} {elapsed * 1000:10.1f} ms {rows / elapsed / 1e6:8.2f} M values/s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args()
+
+    batch = make_batch(args.rows)
+    series = pd.Series(batch, dtype=object)
+
+    legacy, legacy_time = timed('legacy extract_number', lambda: [legacy_extract_number(v) for v in batch], args.rows)
+    scalar, scalar_time = timed('parse_number (loop)', lambda: [parse_number(v) for v in batch], args.rows)
+    vector, vector_time = timed('parse_numbers (vectorized)', lambda: parse_numbers(series), args.rows)
+    numeric = pd.Series(np.random.default_rng(0).uniform(0, 500, args.rows))
+    timed('parse_numbers (numeric column)', lambda: parse_numbers(numeric), args.rows)
+
+    expected = pd.Series(legacy, dtype=float)
+    if scalar != legacy:
+        sys.exit('parse_number differs from the legacy implementation')
+    if not expected.equals(vector):
+        sys.exit('parse_numbers differs from the legacy implementation')
+    cases = pd.Series(list(SIGNED_CASES), dtype=object)
+    expected = pd.Series(list(SIGNED_CASES.values()), dtype=float)
+    if not parse_numbers(cases, signed=True).equals(expected) or \
+            [parse_number(v, signed=True) for v in SIGNED_CASES] != [None if np.isnan(v) else v for v in expected]:
+        sys.exit('signed parsing does not keep negative values')
+    plain = pd.Series(['-3.5', '0', '-12', '4.25'], dtype=object)
+    if not parse_numbers(plain, signed=True).equals(pd.to_numeric(plain).astype(float)):
+        sys.exit('signed parse_numbers differs from pd.to_numeric on plain numbers')
+    print(f"\nparity ok; speedup: loop {legacy_time / scalar_time:.1f}x, vectorized {legacy_time / vector_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Time the cleaner's chunked CLI mode on one process against --workers N on a folder of
+synthetic crawler exports, and check that both produce the same tables.
+
+Run from the repository root:
+    python benchmarks/bench_parallel_clean.py [--files 8] [--rows 200000] [--workers 0]
+
+--workers 0 uses one process per CPU. The cleaner caps workers at the CPU and file counts,
+so on a single-CPU host both runs clean in-process and there is nothing to compare. Exits with an error if the outputs differ beyond
+float rounding (per-file statistics are summed in a different order than one accumulator).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+# clean_data builds its SQLAlchemy engine at import time; no database is used here
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+import data_cleaner.clean_data as cleaner  # noqa: E402
+from bench_chunked_clean import write_export  # noqa: E402
+
+OUTPUTS = ['data_cleaned/cleaned_air_quality.csv', 'data_tranform/AirQualityRecord.csv', 'data_tranform/City.csv',
+           'data_tranform/Source.csv', 'data_tranform/WeatherCondition.csv']
+
+
+def run(root: Path, workers: int, chunk_rows: int) -> float:
+    cleaner.CLEANED_DIR = root / f'workers_{workers}' / 'data_cleaned'
+    cleaner.TRANFORM_DIR = root / f'workers_{workers}' / 'data_tranform'
+    cleaner.CLEANED_DIR.mkdir(parents=True)
+    cleaner.TRANFORM_DIR.mkdir(parents=True)
+    start = time.perf_counter()
+    cleaner.main(['--chunked', '--workers', str(workers), '--chunk-rows', str(chunk_rows)])
+    elapsed = time.perf_counter() - start
+    print(f"{workers:3} worker(s) {elapsed:8.2f} s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=200_000, help="rows per file")
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=50_000)
+    args = parser.parse_args()
+    workers = min(args.workers or os.cpu_count() or 1, os.cpu_count() or 1, args.files)
+    if workers < 2:
+        sys.exit(f"{os.cpu_count()} CPU(s) and {args.files} file(s): the cleaner would use one worker")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        cleaner.CRAWL_DATA_DIR = root / 'data_export'
+        cleaner.CRAWL_DATA_DIR.mkdir()
+        for i in range(args.files):
+            write_export(cleaner.CRAWL_DATA_DIR / f'air_quality_vietnam_{i:03d}.csv', args.rows, seed=i)
+        print(f"{args.files} files x {args.rows:,} rows, {os.cpu_count()} CPUs")
+
+        serial_time = run(root, 1, args.chunk_rows)
+        parallel_time = run(root, workers, args.chunk_rows)
+
+        for output in OUTPUTS:
+            expected = pd.read_csv(root / 'workers_1' / output)
+            actual = pd.read_csv(root / f'workers_{workers}' / output)
+            numeric = expected.select_dtypes('number').columns
+            if not expected.drop(columns=numeric).equals(actual.drop(columns=numeric)) or \
+                    not np.allclose(expected[numeric], actual[numeric], rtol=1e-12, equal_nan=True):
+                sys.exit(f"{output} differs between 1 and {workers} workers")
+    print(f"\noutputs match; speedup {serial_time / parallel_time:.1f}x with {workers} workers")
+
+
+if __name__ == '__main__':
+    main()
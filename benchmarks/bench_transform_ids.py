@@ -0,0 +1,122 @@
+"""
+Regression benchmark for transform_data's dimension-key mapping: the vectorized
+map_dimension_keys path against the original row-wise df.apply / dict lookups on a
+synthetic cleaned frame.
+
+Run from the repository root:
+    python benchmarks/bench_transform_ids.py [--rows 1000000] [--cities 60]
+
+Exits with an error unless every output table (AirQualityRecord, City, Source,
+WeatherCondition) serializes to byte-identical CSV.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# clean_data builds its SQLAlchemy engine at import time; no database is used here
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+from data_cleaner.clean_data import transform_data  # noqa: E402
+
+SOURCES = ['waqi', 'iqair', 'openweathermap']
+CONDITIONS = ['cloudy', 'clear', 'rain', 'mist', 'unknown']
+
+
+def legacy_transform_data(df: pd.DataFrame):
+    """transform_data before the vectorized key mapping."""
+    cities = (
+        df[['city', 'province', 'latitude', 'longitude']]
+        .drop_duplicates()
+        .reset_index(drop=True)
+        .assign(city_id=lambda x: x.index + 1)
+        [['city_id', 'city', 'province', 'latitude', 'longitude']]
+        .rename(columns={'city': 'city_name'})
+    )
+    sources = (
+        df[['source']]
+        .drop_duplicates()
+        .reset_index(drop=True)
+        .assign(source_id=lambda x: x.index + 1)
+        [['source_id', 'source']]
+        .rename(columns={'source': 'source_name'})
+    )
+    conditions = (
+        df[['weather_condition']]
+        .drop_duplicates()
+        .reset_index(drop=True)
+        .assign(condition_id=lambda x: x.index + 1)
+        [['condition_id', 'weather_condition']]
+        .rename(columns={'weather_condition': 'condition_name'})
+    )
+    city_map = cities.set_index(['city_name', 'province'])['city_id'].to_dict()
+    source_map = sources.set_index('source_name')['source_id'].to_dict()
+    condition_map = conditions.set_index('condition_name')['condition_id'].to_dict()
+    df['city_id'] = df.apply(lambda x: city_map.get((x['city'], x['province'])), axis=1)
+    df['source_id'] = df['source'].map(source_map)
+    df['condition_id'] = df['weather_condition'].map(condition_map)
+    air_quality = (
+        df[[
+            'timestamp', 'city_id', 'source_id', 'condition_id', 'aqi', 'pm25', 'pm10', 'o3',
+            'no2', 'so2', 'co', 'nh3', 'temperature', 'humidity', 'pressure', 'wind_speed',
+            'wind_direction', 'visibility', 'status'
+        ]]
+        .reset_index(drop=True)
+        .assign(record_id=lambda x: x.index + 1)
+    )
+    return {'AirQualityRecord': air_quality, 'City': cities, 'Source': sources, 'WeatherCondition': conditions}
+
+
+def make_frame(rows: int, cities: int, seed: int = 42) -> pd.DataFrame:
+    """Cleaned-looking frame; a few cities report two coordinate pairs, as real sources do."""
+    rng = np.random.default_rng(seed)
+    city_ids = rng.integers(0, cities, rows)
+    # every 10th city has a second station with slightly different coordinates
+    shifted = (city_ids % 10 == 0) & (rng.random(rows) < 0.5)
+    frame = pd.DataFrame({
+        'timestamp': pd.Series(pd.date_range('2024-01-01', periods=rows, freq='min').strftime('%Y-%m-%d %H:%M:%S')),
+        'city': [f"city {i}" for i in city_ids],
+        'province': [f"province {i // 2}" for i in city_ids],
+        'latitude': np.round(8 + city_ids * 0.2 + shifted * 0.01, 4),
+        'longitude': np.round(102 + city_ids * 0.1, 4),
+        'source': rng.choice(SOURCES, rows),
+        'weather_condition': rng.choice(CONDITIONS, rows),
+        'status': rng.choice(['success', 'unknown'], rows),
+    })
+    for col in ['aqi', 'pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'nh3', 'temperature', 'humidity',
+                'pressure', 'wind_speed', 'wind_direction', 'visibility']:
+        frame[col] = np.round(rng.uniform(0, 300, rows), 2)
+    return frame
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:24} {elapsed:8.2f} s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--cities', type=int, default=60)
+    args = parser.parse_args()
+
+    frame = make_frame(args.rows, args.cities)
+    print(f"{args.rows:,} rows, {args.cities} cities")
+    expected, legacy_time = timed('legacy df.apply', lambda: legacy_transform_data(frame.copy()))
+    actual, fast_time = timed('map_dimension_keys', lambda: transform_data(frame.copy()))
+
+    for table, expected_table in expected.items():
+        if actual[table].to_csv(index=False) != expected_table.to_csv(index=False):
+            sys.exit(f"{table} differs from the original implementation")
+    print(f"\nall tables byte-identical; speedup {legacy_time / fast_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+So sánh bộ trích xuất regex của crawler với cách cũ dùng BeautifulSoup(html.parser)
+trên các trang aqicn.org mẫu trong fixtures/waqi.
+
+Chạy từ thư mục gốc của repo (beautifulsoup4 có trong benchmarks/requirements.txt):
+    python benchmarks/bench_waqi_html.py [--iterations 200]
+
+Script dừng với lỗi nếu thiếu beautifulsoup4 hoặc hai cách cho kết quả khác nhau trên
+bất kỳ fixture nào.
+"""
+import argparse
+import re
+import sys
+import timeit
+from pathlib import Path
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    sys.exit("beautifulsoup4 is required for the parity check: pip install -r benchmarks/requirements.txt")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from data_crawler.data_crawler import AirQualityCrawler  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures' / 'waqi'
+# Chèn thêm markup không liên quan để giả lập kích thước trang thật (~300 KB)
+PADDING = '<div class="row"><span class="label">x</span><td>1</td></div>\n' * 5000
+
+
+def extract_with_bs4(crawler: AirQualityCrawler, content: bytes):
+    """Đường trích xuất cũ của crawl_waqi_data"""
+    soup = BeautifulSoup(content, 'html.parser')
+    aqi_elem = soup.find('div', {'id': 'aqiwgtvalue'})
+    if not aqi_elem:
+        aqi_elem = soup.find('span', class_='aqivalue')
+    if not aqi_elem:
+        aqi_elem = soup.find('div', class_='aqivalue')
+    if not aqi_elem or not aqi_elem.text.strip():
+        return None
+    aqi_value = crawler.extract_number(aqi_elem.text.strip())
+    if not aqi_value:
+        return None
+    pollutants = {}
+    for pollutant in ['pm25', 'pm10', 'o3', 'no2', 'so2', 'co']:
+        elem = soup.find('td', {'id': f'cur_{pollutant}'})
+        if elem:
+            pollutants[pollutant] = crawler.extract_number(elem.text)
+    return {'aqi': aqi_value, **pollutants}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    crawler = AirQualityCrawler()
+    fixtures = sorted(FIXTURES_DIR.glob('*.html'))
+    pages = {path.name: path.read_bytes() for path in fixtures}
+    for name, content in list(pages.items()):
+        padded = re.sub(r'(<body>)', lambda m: m.group(1) + '\n' + PADDING, content.decode('utf-8'),
+                        count=1, flags=re.IGNORECASE)
+        pages[f"{name} (padded)"] = padded.encode('utf-8')
+
+    mismatches = 0
+    for name, content in pages.items():
+        expected = extract_with_bs4(crawler, content)
+        actual = crawler._extract_waqi_html(content)
+        # Đường cũ không đọc mốc cập nhật của trạm
+        if actual:
+            actual.pop('updated', None)
+        status = 'ok' if expected == actual else 'MISMATCH'
+        mismatches += expected != actual
+        print(f"{status:8} {name}: {actual}" + ('' if expected == actual else f" (bs4: {expected})"))
+    if mismatches:
+        sys.exit(f"{mismatches} fixture(s) differ from the BeautifulSoup path")
+
+    print(f"\n{'page':45} {'bs4 ms':>10} {'regex ms':>10} {'speedup':>8}")
+    for name, content in pages.items():
+        bs4_time = timeit.timeit(lambda: extract_with_bs4(crawler, content), number=args.iterations)
+        fast_time = timeit.timeit(lambda: crawler._extract_waqi_html(content), number=args.iterations)
+        print(f"{name:45} {bs4_time / args.iterations * 1000:10.3f} "
+              f"{fast_time / args.iterations * 1000:10.3f} {bs4_time / fast_time:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Ingestion version stamp shared by the cleaner (writer) and the API (reader).
+
+The cleaner bumps a single-row counter after every load that writes rows; the API compares
+it with the version its cached results were computed at, so one cheap lookup tells every API
+worker that the dashboards are stale.
+"""
+from sqlalchemy import BigInteger, Column, DateTime, Integer, MetaData, Table, func, inspect, select, update
+from sqlalchemy.exc import DBAPIError
+
+VERSION_TABLE = 'IngestionVersion'
+
+metadata = MetaData()
+ingestion_version = Table(
+    VERSION_TABLE, metadata,
+    Column('id', Integer, primary_key=True),
+    Column('version', BigInteger, nullable=False),
+    Column('updated_at', DateTime, nullable=False, server_default=func.now()),
+)
+
+
+def ensure_ingestion_version(engine):
+    """Create the version table (read as version 0 until the first bump)."""
+    ingestion_version.create(engine, checkfirst=True)
+
+
+def bump_ingestion_version(engine) -> int:
+    """Increment the version (creating the table and its row on first use) and return it."""
+    ingestion_version.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        bumped = conn.execute(update(ingestion_version).where(ingestion_version.c.id == 1)
+                              .values(version=ingestion_version.c.version + 1, updated_at=func.now()))
+        if bumped.rowcount == 0:
+            conn.execute(ingestion_version.insert().values(id=1, version=1))
+        return conn.execute(select(ingestion_version.c.version).where(ingestion_version.c.id == 1)).scalar_one()
+
+
+def read_ingestion_version(engine) -> int:
+    """Current version; 0 until the cleaner has loaded anything (table or row not created yet)."""
+    try:
+        with engine.connect() as conn:
+            version = conn.execute(select(ingestion_version.c.version)
+                                   .where(ingestion_version.c.id == 1)).scalar_one_or_none()
+    except DBAPIError:
+        if inspect(engine).has_table(VERSION_TABLE):
+            raise
+        return 0
+    return version or 0
+
+
+async def read_ingestion_version_async(engine) -> int:
+    """read_ingestion_version for an AsyncEngine."""
+    try:
+        async with engine.connect() as conn:
+            version = (await conn.execute(select(ingestion_version.c.version)
+                                          .where(ingestion_version.c.id == 1))).scalar_one_or_none()
+    except DBAPIError:
+        async with engine.connect() as conn:
+            exists = await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(VERSION_TABLE))
+        if exists:
+            raise
+        return 0
+    return version or 0
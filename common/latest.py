@@ -0,0 +1,96 @@
+"""
+LatestAirQuality: the newest AirQualityRecord row per (city, source), written by the cleaner
+and read by the API's current-state endpoints (/latest-by-city, /map-data, the dashboard)
+instead of sorting the whole fact table.
+
+After a load the cleaner recomputes the snapshot rows of the pairs that have records at or
+after the batch's earliest timestamp, from the fact table itself, so upserts that keep or
+overwrite existing rows leave the snapshot matching what is stored. A pair's newest row is
+never older than anything the batch wrote for it, which is what bounds that scan.
+"""
+import pandas as pd
+from sqlalchemy import BigInteger, Column, DateTime, Float, Integer, MetaData, Table, Text, bindparam, inspect, text
+
+from common.schema import MEASURE_COLUMNS
+
+FACT_TABLE = 'AirQualityRecord'
+LATEST_TABLE = 'LatestAirQuality'
+
+metadata = MetaData()
+latest_air_quality = Table(
+    LATEST_TABLE, metadata,
+    Column('timestamp', DateTime),
+    Column('city_id', Integer, primary_key=True, autoincrement=False),
+    Column('source_id', Integer, primary_key=True, autoincrement=False),
+    Column('condition_id', Integer),
+    *[Column(name, Float) for name in MEASURE_COLUMNS],
+    Column('status', Text),
+    Column('record_id', BigInteger),
+)
+
+
+def _refresh_sql(columns, since: bool) -> str:
+    quoted = ', '.join(f'"{column}"' for column in columns)
+    selected = ', '.join(f'a."{column}"' for column in columns)
+    updates = ', '.join(f'"{column}" = excluded."{column}"' for column in columns
+                        if column not in ('city_id', 'source_id'))
+    window = 'AND timestamp >= :low' if since else ''
+    tiebreak = 'a.record_id' if 'record_id' in columns else 'a.timestamp'
+    # A legacy fact table not deduplicated yet may store a pair's newest reading twice, and
+    # ON CONFLICT must see each pair once. SQLite needs a WHERE clause on
+    # INSERT ... SELECT ... ON CONFLICT to parse it
+    return f'''
+        INSERT INTO "{LATEST_TABLE}" ({quoted})
+        SELECT {quoted} FROM (
+            SELECT {selected}, ROW_NUMBER() OVER (PARTITION BY a.city_id, a.source_id ORDER BY {tiebreak}) AS copy
+            FROM "{FACT_TABLE}" a
+            JOIN (
+                SELECT city_id, source_id, MAX(timestamp) AS newest
+                FROM "{FACT_TABLE}"
+                WHERE city_id IS NOT NULL AND source_id IS NOT NULL {window}
+                GROUP BY city_id, source_id
+            ) m ON a.city_id = m.city_id AND a.source_id = m.source_id AND a.timestamp = m.newest
+            WHERE a.timestamp IS NOT NULL
+        ) newest
+        WHERE copy = 1
+        ON CONFLICT (city_id, source_id) DO UPDATE SET {updates}
+    '''
+
+
+def refresh_latest(engine, timestamps: pd.Series = None) -> int:
+    """
+    Upsert the snapshot rows of every (city, source) pair with records at or after the
+    earliest of timestamps; timestamps=None, or a snapshot table that did not exist yet,
+    recomputes every pair. Pairs whose records were all dropped by retention keep their
+    last reading. Returns the snapshot rows written.
+    """
+    missing = not inspect(engine).has_table(LATEST_TABLE)
+    latest_air_quality.create(engine, checkfirst=True)
+    if timestamps is not None:
+        timestamps = pd.to_datetime(timestamps, errors='coerce').dropna()
+        if timestamps.empty and not missing:
+            return 0
+    since = timestamps is not None and not missing
+    # Legacy fact tables may lack some of the snapshot's columns
+    fact_columns = {column['name'] for column in inspect(engine).get_columns(FACT_TABLE)}
+    columns = [column.name for column in latest_air_quality.columns if column.name in fact_columns]
+    query = text(_refresh_sql(columns, since))
+    params = {}
+    if since:
+        query = query.bindparams(bindparam('low', type_=DateTime))
+        params['low'] = timestamps.min().to_pydatetime()
+    with engine.begin() as conn:
+        return conn.execute(query, params).rowcount
+
+
+def ensure_latest(engine) -> int:
+    """
+    Create the snapshot table if missing and fill it from AirQualityRecord while it is
+    empty, so the current-state endpoints work before the cleaner's first load. Returns
+    the snapshot rows written.
+    """
+    latest_air_quality.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        if conn.execute(text(f'SELECT 1 FROM "{LATEST_TABLE}" LIMIT 1')).first() is not None:
+            return 0
+    return refresh_latest(engine)
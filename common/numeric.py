@@ -0,0 +1,72 @@
+"""Number parsing shared by the crawler (scraped HTML cells) and the cleaner (messy CSV columns)."""
+import math
+import re
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow is optional here; parse_numbers falls back to pandas str.extract
+    pa = None
+
+# First number in the text; a comma is accepted as the decimal separator ("0,4" -> 0.4)
+NUMBER_PATTERN = r'(\d+(?:[.,]\d*)?)'
+NUMBER_RE = re.compile(NUMBER_PATTERN)
+# Same with an optional leading minus, for CSV columns where "-3.5" is a negative value
+SIGNED_NUMBER_PATTERN = r'(-?\d+(?:[.,]\d*)?)'
+SIGNED_NUMBER_RE = re.compile(SIGNED_NUMBER_PATTERN)
+
+
+def parse_number(value, signed: bool = False) -> Optional[float]:
+    """
+    Parse one scraped value into a float.
+
+    int/float input is returned as-is (non-finite -> None). Text returns the first number
+    it contains, so units and labels around it are ignored ("42 µg/m³" -> 42.0); a leading
+    minus is only part of the match with signed=True. Empty or number-free input returns None.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) if math.isfinite(value) else None
+    if not value:
+        return None
+    pattern = SIGNED_NUMBER_RE if signed else NUMBER_RE
+    match = pattern.search(value if isinstance(value, str) else str(value))
+    if match is None:
+        return None
+    return float(match.group(1).replace(',', '.'))
+
+
+def parse_numbers(values, signed: bool = False) -> pd.Series:
+    """
+    Vectorized parse_number for a whole column/list of values, returning a float Series
+    (NaN where no number is found).
+
+    Numeric dtypes take a fast path with a plain cast. Other dtypes are parsed as text in a
+    single regex pass, which is how CSV columns with units or stray characters come out of
+    read_csv; with pyarrow installed the extraction and float cast run in Arrow compute
+    kernels instead of pandas str.extract.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        result = series.astype(float)
+        return result.where(np.isfinite(result))
+    pattern = SIGNED_NUMBER_PATTERN if signed else NUMBER_PATTERN
+    if pa is not None:
+        return _parse_numbers_arrow(series, pattern)
+    extracted = series.astype('string').str.extract(pattern, expand=False)
+    return pd.to_numeric(extracted.str.replace(',', '.', regex=False), errors='coerce').astype(float)
+
+
+def _parse_numbers_arrow(series: pd.Series, pattern: str) -> pd.Series:
+    try:
+        text = pa.array(series, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed object column (e.g. floats and strings): stringify first
+        text = pa.array(series.astype('string'), type=pa.string(), from_pandas=True)
+    # extract_regex needs the capture group to be named
+    numbers = pc.struct_field(pc.extract_regex(text, pattern.replace('(', '(?P<number>', 1)), [0])
+    numbers = pc.cast(pc.replace_substring(numbers, ',', '.'), pa.float64())
+    return pd.Series(numbers.to_numpy(zero_copy_only=False), index=series.index, name=series.name)
@@ -0,0 +1,104 @@
+"""
+Hourly and daily AirQualityRecord rollups per (city, source), written by the cleaner and read
+by the API's aggregate endpoints instead of scanning the whole fact table.
+
+Each rollup row keeps counts, sums and maxima rather than averages, so any coarser grouping
+(per city and day across sources, per province over all history) is exact: an average is
+SUM(*_sum) / SUM(*_count). After a load the cleaner recomputes only the buckets the batch
+touched, from the fact table itself, which keeps upserts that overwrite rows correct.
+"""
+import datetime
+from typing import Dict
+
+import pandas as pd
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, Integer, MetaData, Table, bindparam, inspect, text
+
+FACT_TABLE = 'AirQualityRecord'
+# Rollup table -> bucket width (as named by date_trunc)
+ROLLUP_GRAINS = {
+    'AirQualityHourly': 'hour',
+    'AirQualityDaily': 'day',
+}
+GRAIN_FREQ = {'hour': 'h', 'day': 'D'}
+GRAIN_STEP = {'hour': datetime.timedelta(hours=1), 'day': datetime.timedelta(days=1)}
+ROLLUP_MEASURES = ['aqi', 'pm25']
+# Typed binds so SQLite compares against the string format SQLAlchemy stores DateTime in
+BUCKET_BOUNDS = [bindparam('low', type_=DateTime), bindparam('high', type_=DateTime)]
+
+metadata = MetaData()
+
+
+def _rollup_table(name: str) -> Table:
+    columns = [Column('bucket', DateTime, nullable=False), Column('city_id', Integer), Column('source_id', Integer),
+               Column('record_count', BigInteger, nullable=False)]
+    for measure in ROLLUP_MEASURES:
+        columns += [Column(f'{measure}_count', BigInteger, nullable=False), Column(f'{measure}_sum', Float),
+                    Column(f'{measure}_max', Float)]
+    return Table(name, metadata, *columns, Index(f'ix_{name}_bucket_city', 'bucket', 'city_id'))
+
+
+ROLLUP_TABLES = {name: _rollup_table(name) for name in ROLLUP_GRAINS}
+
+
+def _bucket_sql(dialect: str, grain: str) -> str:
+    if dialect == 'postgresql':
+        return f"date_trunc('{grain}', timestamp)"
+    fmt = '%Y-%m-%d %H:00:00.000000' if grain == 'hour' else '%Y-%m-%d 00:00:00.000000'
+    return f"strftime('{fmt}', timestamp)"
+
+
+def _aggregate_sql(table: str, bucket: str) -> str:
+    measures = [f'{name}_{agg}' for name in ROLLUP_MEASURES for agg in ('count', 'sum', 'max')]
+    aggregates = [f'{agg.upper()}({name})' for name in ROLLUP_MEASURES for agg in ('count', 'sum', 'max')]
+    return f'''
+        INSERT INTO "{table}" (bucket, city_id, source_id, record_count, {', '.join(measures)})
+        SELECT {bucket}, city_id, source_id, COUNT(*), {', '.join(aggregates)}
+        FROM "{FACT_TABLE}"
+        WHERE timestamp >= :low AND timestamp < :high
+        GROUP BY 1, city_id, source_id
+    '''
+
+
+def refresh_rollups(engine, timestamps: pd.Series = None) -> Dict[str, int]:
+    """
+    Recompute the rollup buckets covering timestamps (every bucket between the earliest and
+    latest one) from the fact table; timestamps=None, or a rollup table that did not exist
+    yet, rebuilds every bucket the fact table still has rows for. Buckets older than that
+    are kept, so rollups outlive fact partitions dropped by retention. Returns the rollup
+    rows written per table.
+    """
+    dialect = engine.dialect.name
+    missing = {name for name in ROLLUP_TABLES if not inspect(engine).has_table(name)}
+    metadata.create_all(engine, tables=list(ROLLUP_TABLES.values()), checkfirst=True)
+    if timestamps is not None:
+        timestamps = pd.to_datetime(timestamps, errors='coerce').dropna()
+    history = None
+    if timestamps is None or missing:
+        with engine.connect() as conn:
+            history = pd.to_datetime(pd.Series(conn.execute(
+                text(f'SELECT MIN(timestamp), MAX(timestamp) FROM "{FACT_TABLE}"')).one()), errors='coerce').dropna()
+    written = {}
+    with engine.begin() as conn:
+        for name, grain in ROLLUP_GRAINS.items():
+            covered = history if timestamps is None or name in missing else timestamps
+            if covered.empty:
+                continue
+            low = covered.min().floor(GRAIN_FREQ[grain]).to_pydatetime()
+            high = covered.max().floor(GRAIN_FREQ[grain]).to_pydatetime() + GRAIN_STEP[grain]
+            bounds = {'low': low, 'high': high}
+            conn.execute(text(f'DELETE FROM "{name}" WHERE bucket >= :low AND bucket < :high')
+                         .bindparams(*BUCKET_BOUNDS), bounds)
+            aggregate = text(_aggregate_sql(name, _bucket_sql(dialect, grain)))
+            written[name] = conn.execute(aggregate.bindparams(*BUCKET_BOUNDS), bounds).rowcount
+    return written
+
+
+def ensure_rollups(engine) -> Dict[str, int]:
+    """
+    Create the rollup tables if any is missing, filled from the records AirQualityRecord
+    already holds, so the aggregate endpoints work before the cleaner's first load.
+    Returns the rollup rows written (nothing when every table exists).
+    """
+    if all(inspect(engine).has_table(name) for name in ROLLUP_TABLES):
+        return {}
+    return refresh_rollups(engine)
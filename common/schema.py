@@ -0,0 +1,199 @@
+"""Typed table definitions, API indexes and monthly partitions shared by the cleaner and the API."""
+import argparse
+import datetime
+import os
+import re
+import threading
+from typing import Iterable, List
+
+import pandas as pd
+from sqlalchemy import (BigInteger, Column, DateTime, Float, Index, Integer, MetaData, PrimaryKeyConstraint, Table,
+                        Text, inspect, text)
+
+MEASURE_COLUMNS = ['aqi', 'pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'nh3', 'temperature', 'humidity', 'pressure',
+                   'wind_speed', 'wind_direction', 'visibility']
+
+metadata = MetaData()
+
+city = Table(
+    'City', metadata,
+    Column('city_id', Integer, primary_key=True, autoincrement=False),
+    Column('city_name', Text),
+    Column('province', Text),
+    Column('latitude', Float),
+    Column('longitude', Float),
+)
+
+source = Table(
+    'Source', metadata,
+    Column('source_id', Integer, primary_key=True, autoincrement=False),
+    Column('source_name', Text),
+)
+
+weather_condition = Table(
+    'WeatherCondition', metadata,
+    Column('condition_id', Integer, primary_key=True, autoincrement=False),
+    Column('condition_name', Text),
+)
+
+air_quality_record = Table(
+    'AirQualityRecord', metadata,
+    Column('timestamp', DateTime),
+    Column('city_id', Integer),
+    Column('source_id', Integer),
+    Column('condition_id', Integer),
+    *[Column(name, Float) for name in MEASURE_COLUMNS],
+    Column('status', Text),
+    Column('record_id', BigInteger, autoincrement=False),
+    # Keys of a partitioned table must include the partition column
+    PrimaryKeyConstraint('record_id', 'timestamp'),
+    postgresql_partition_by='RANGE (timestamp)',
+)
+# Natural key of the cleaner's upserts; same name as ensure_unique_key gives it
+Index('AirQualityRecord_city_id_source_id_timestamp_key', air_quality_record.c.city_id,
+      air_quality_record.c.source_id, air_quality_record.c.timestamp, unique=True)
+# ORDER BY timestamp DESC LIMIT n, and the time-bucket ranges the rollups re-aggregate
+Index('ix_AirQualityRecord_timestamp', air_quality_record.c.timestamp.desc())
+# /time-series (WHERE city_id = ...) and /latest-by-city (newest row per city)
+Index('ix_AirQualityRecord_city_id_timestamp', air_quality_record.c.city_id, air_quality_record.c.timestamp.desc())
+Index('ix_AirQualityRecord_source_id', air_quality_record.c.source_id)
+
+FACT_TABLE = air_quality_record.name
+PARTITION_NAME_RE = re.compile(rf'^{FACT_TABLE}_(\d{{4}})_(\d{{2}})$')
+
+_ensured = set()
+_partitions = set()
+_lock = threading.Lock()
+
+
+def ensure_schema(engine, force: bool = False):
+    """Create missing tables and indexes; after the first call per engine URL this is a no-op unless force."""
+    key = engine.url.render_as_string(hide_password=False)
+    with _lock:
+        if key in _ensured and not force:
+            return
+        existing = set(inspect(engine).get_table_names())
+        metadata.create_all(engine, checkfirst=True)
+        for table in metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            # Tables written earlier by to_sql may still repeat keys: they only gain the non-unique indexes
+            for index in table.indexes:
+                if not index.unique:
+                    index.create(engine, checkfirst=True)
+        _ensured.add(key)
+
+
+def is_partitioned(engine) -> bool:
+    """Whether AirQualityRecord is a partitioned table (PostgreSQL only)."""
+    if engine.dialect.name != 'postgresql':
+        return False
+    with engine.connect() as conn:
+        return bool(conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"), {'name': FACT_TABLE}).scalar())
+
+
+def month_start(value) -> datetime.datetime:
+    value = pd.Timestamp(value)
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def add_months(month: datetime.datetime, months: int) -> datetime.datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.datetime) -> str:
+    return f'{FACT_TABLE}_{month.year:04d}_{month.month:02d}'
+
+
+def _create_partitions(conn, first: datetime.datetime, last: datetime.datetime, key: str = None):
+    month = first
+    while month <= last:
+        name = partition_name(month)
+        if (key, name) not in _partitions:
+            conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{FACT_TABLE}" '
+                              f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"))
+            if key is not None:
+                _partitions.add((key, name))
+        month = add_months(month, 1)
+
+
+def ensure_partitions(engine, timestamps: Iterable = (), months_ahead: int = 2) -> bool:
+    """Create the monthly partitions covering timestamps and the next months_ahead; False if unpartitioned."""
+    if not is_partitioned(engine):
+        return False
+    timestamps = pd.to_datetime(pd.Series(timestamps, dtype=object), errors='coerce').dropna()
+    months = [month_start(timestamps.min()), month_start(timestamps.max())] if len(timestamps) else []
+    current = month_start(datetime.datetime.now())
+    first, last = min(months + [current]), max(months + [add_months(current, months_ahead)])
+    key = engine.url.render_as_string(hide_password=False)
+    with _lock, engine.begin() as conn:
+        _create_partitions(conn, first, last, key)
+    return True
+
+
+def drop_expired_partitions(engine, retention_months: int, now: datetime.datetime = None) -> List[str]:
+    """Drop the monthly partitions older than retention_months (<= 0 keeps all) and return their names."""
+    if retention_months <= 0 or not is_partitioned(engine):
+        return []
+    cutoff = add_months(month_start(now or datetime.datetime.now()), -retention_months)
+    with engine.connect() as conn:
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass)"), {'parent': f'"{FACT_TABLE}"'}).scalars().all()
+    expired = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match and add_months(datetime.datetime(int(match[1]), int(match[2]), 1), 1) <= cutoff:
+            expired.append(name)
+    with _lock, engine.begin() as conn:
+        for name in sorted(expired):
+            conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            _partitions.difference_update({item for item in _partitions if item[1] == name})
+    return sorted(expired)
+
+
+def partition_existing_table(engine, months_ahead: int = 2) -> int:
+    """Convert an AirQualityRecord heap table to the partitioned layout and return the rows copied."""
+    if engine.dialect.name != 'postgresql':
+        raise RuntimeError("Partitioning needs PostgreSQL")
+    if not inspect(engine).has_table(FACT_TABLE) or is_partitioned(engine):
+        return 0
+    old_table = f'{FACT_TABLE}_unpartitioned'
+    old_columns = {column['name'] for column in inspect(engine).get_columns(FACT_TABLE)}
+    old_indexes = [index['name'] for index in inspect(engine).get_indexes(FACT_TABLE)]
+    columns = ', '.join(f'"{column.name}"' for column in air_quality_record.columns if column.name in old_columns)
+    with _lock, engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE "{FACT_TABLE}" RENAME TO "{old_table}"'))
+        # The old table's index names would clash with the new table's
+        for name in old_indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+        air_quality_record.create(conn)
+        bounds = conn.execute(text(f'SELECT MIN(timestamp), MAX(timestamp) FROM "{old_table}"')).one()
+        current = month_start(datetime.datetime.now())
+        first = min(month_start(bounds[0]), current) if bounds[0] is not None else current
+        last = max(month_start(bounds[1]), current) if bounds[1] is not None else current
+        _create_partitions(conn, first, add_months(last, months_ahead))
+        copied = conn.execute(text(f'INSERT INTO "{FACT_TABLE}" ({columns}) SELECT {columns} FROM "{old_table}" '
+                                   f'WHERE timestamp IS NOT NULL ON CONFLICT DO NOTHING')).rowcount
+        conn.execute(text(f'DROP TABLE "{old_table}"'))
+    return copied
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description="Create or upgrade the air quality schema.")
+    parser.add_argument('--partition', action='store_true',
+                        help="convert an existing unpartitioned AirQualityRecord into monthly partitions")
+    args = parser.parse_args()
+    load_dotenv()
+    db_engine = create_engine(os.getenv('DATABASE_URL'))
+    ensure_schema(db_engine)
+    if args.partition:
+        print(f"Copied {partition_existing_table(db_engine)} records into the partitioned AirQualityRecord")
+    ensure_partitions(db_engine)
+    print("Schema is up to date")
@@ -1,22 +1,42 @@
 import requests
+from requests.adapters import HTTPAdapter
+import aiohttp
+import asyncio
 import pandas as pd
 import json
 import time
 from datetime import datetime, timedelta
 import logging
-from bs4 import BeautifulSoup
 from typing import Dict, List, Optional
 import re
 import os
-from urllib.parse import urljoin
+import html
+import hashlib
+import zlib
+from urllib.parse import urljoin, urlencode
 import random
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import sys
+import threading
+import uuid
+from email.utils import parsedate_to_datetime
 import schedule
 from pathlib import Path
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 import pytz
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # chỉ cần khi EXPORT_FORMAT có parquet
+    pa = None
+
+# Cho phép import package dùng chung (common/) khi chạy trực tiếp `python data_crawler/data_crawler.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.numeric import parse_number
+
 app = FastAPI()
 
 def get_vietnam_time_str(fmt: str = "%Y-%m-%d %H:%M:%S") -> str:
@@ -29,6 +49,8 @@ async def run_crawl(request: Request):
     """
     Cho phép truyền API key động qua body JSON (ưu tiên), hoặc lấy từ biến môi trường.
     Nếu body không phải JSON hợp lệ, sẽ bỏ qua và chỉ lấy từ biến môi trường.
+    Crawl chạy trên thread nền của CRAWL_RUNS nên event loop không bị chặn; với "mode": "queue"
+    (hoặc CRAWL_RUN_MODE=queue) endpoint trả run_id ngay để hỏi lại qua /crawl_runs/{run_id}.
     """
     try:
         if request.headers.get("content-type", "").startswith("application/json"):
@@ -37,25 +59,63 @@ async def run_crawl(request: Request):
             body = {}
     except Exception:
         body = {}
+    if not isinstance(body, dict):
+        body = {}
 
     iqair_api_key = None
-    openweather_api_key = body.get("openweather_api_key") if isinstance(body, dict) else None
-    waqi_token = body.get("waqi_token") if isinstance(body, dict) else None
+    openweather_api_key = body.get("openweather_api_key")
+    waqi_token = body.get("waqi_token")
+    crawl_mode = body.get("crawl_mode")
+    include_csv_content = body.get("include_csv_content")
 
     # Nếu không truyền qua body thì lấy từ biến môi trường
     if not openweather_api_key:
         openweather_api_key = os.getenv('OPENWEATHER_API_KEY')
     if not waqi_token:
         waqi_token = os.getenv('WAQI_TOKEN', 'demo')
+    if not crawl_mode:
+        crawl_mode = CRAWL_MODE
+    if include_csv_content is None:
+        include_csv_content = INCLUDE_CSV_CONTENT
 
-    crawler = AirQualityCrawler()
-    result = crawler.run_optimized_crawl(
-        iqair_api_key,
-        openweather_api_key,
-        waqi_token
-    )
+    run, created = CRAWL_RUNS.submit(iqair_api_key, openweather_api_key, waqi_token,
+                                     crawl_mode=crawl_mode, include_csv_content=bool(include_csv_content))
+    if not created:
+        logger.info(f"Crawl run {run.run_id} with the same parameters is already {run.status}, "
+                    f"joining it instead of starting another")
+    if (body.get("mode") or CRAWL_RUN_MODE) == 'queue':
+        return {"status": run.status, "run_id": run.run_id, "run_url": f"/crawl_runs/{run.run_id}",
+                "deduplicated": not created}
+
+    await asyncio.wrap_future(run.future)
     # Đảm bảo trả về JSON hợp lệ cho n8n
-    return result
+    if run.result is None:
+        return {"success": False, "error": run.error, "run_id": run.run_id}
+    return {**run.result, "run_id": run.run_id}
+
+
+@app.get("/crawl_runs/{run_id}")
+def get_crawl_run(run_id: str):
+    """Trạng thái, thời gian và kết quả của một lượt crawl"""
+    run = CRAWL_RUNS.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Unknown crawl run: {run_id}")
+    return run.to_dict()
+
+
+@app.get("/crawl_batches/{batch_id}")
+def stream_crawl_batch(batch_id: str):
+    """
+    Stream bản ghi của một lượt crawl dưới dạng NDJSON (mỗi dòng một bản ghi) để cleaner
+    đọc theo từng lô, thay cho chuỗi csv_content nhúng trong JSON.
+    """
+    frames = open_crawl_batch(batch_id)
+    if frames is None:
+        raise HTTPException(status_code=404, detail=f"Unknown crawl batch: {batch_id}")
+    return StreamingResponse(
+        (chunk.to_json(orient='records', lines=True, force_ascii=False) for chunk in frames),
+        media_type="application/x-ndjson"
+    )
 
 
 # Cấu hình logging với encoding UTF-8
@@ -73,9 +133,589 @@ logger = logging.getLogger(__name__)
 SUCCESS_MARK = '+'
 FAIL_MARK = 'x'
 
+# Chế độ crawl mặc định: 'sync' (tuần tự từng nguồn) hoặc 'async' (mọi nguồn đồng thời)
+CRAWL_MODE = os.getenv('CRAWL_MODE', 'sync').lower()
+
+# Số request đồng thời tối đa cho từng nguồn (số thread theo thành phố ở chế độ sync, semaphore ở chế độ async)
+SOURCE_CONCURRENCY = {
+    'iqair': int(os.getenv('IQAIR_CONCURRENCY', '2')),
+    'waqi': int(os.getenv('WAQI_CONCURRENCY', '4')),
+    'openweathermap': int(os.getenv('OPENWEATHER_CONCURRENCY', '4')),
+}
+
+# Quota theo từng host dạng "số_request/phút[:burst]", ghi đè bằng biến môi trường <NGUỒN>_RATE_LIMIT
+DEFAULT_RATE_LIMITS = {
+    'iqair': '5:1',            # api.airvisual.com - gói Community 5 request/phút
+    'waqi': '600:10',          # api.waqi.info
+    'waqi_web': '60:2',        # aqicn.org (scraping)
+    'openweathermap': '60:5',  # api.openweathermap.org - gói Free 60 request/phút
+}
+# Số giây chờ khi nhận 429 mà không có header Retry-After
+DEFAULT_RETRY_AFTER = 60
+# Số lần thử lại một thành phố WAQI (lớp retry duy nhất; nhịp chờ do rate limiter quyết định)
+WAQI_CITY_ATTEMPTS = 3
+
+# Định dạng file export: 'csv', 'parquet' (data_export_parquet/date=YYYY-MM-DD/) hoặc 'both'
+EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'csv').lower()
+EXPORT_NUMERIC_COLUMNS = ['aqi', 'aqi_cn', 'pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'nh3',
+                          'temperature', 'humidity', 'pressure', 'wind_speed', 'wind_direction',
+                          'visibility', 'uv_index', 'latitude', 'longitude']
+EXPORT_COLUMN_ORDER = ['timestamp', 'observed_at', 'city', 'province', 'city_source', 'latitude', 'longitude',
+                       'aqi', 'aqi_cn', 'pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'nh3',
+                       'temperature', 'humidity', 'pressure', 'wind_speed', 'wind_direction',
+                       'visibility', 'uv_index', 'weather_condition', 'source', 'status']
+# Cột lặp lại nhiều lần giữa các bản ghi, lưu dạng dictionary (categorical khi đọc bằng pandas)
+EXPORT_CATEGORY_COLUMNS = ['city', 'province', 'city_source', 'source']
+
+
+def build_parquet_schema():
+    """Schema cố định cho mọi file Parquet để các partition đọc chung được thành một dataset"""
+    fields = []
+    for col in EXPORT_COLUMN_ORDER:
+        if col in ('timestamp', 'observed_at'):
+            fields.append(pa.field(col, pa.timestamp('s')))
+        elif col in EXPORT_CATEGORY_COLUMNS:
+            fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+        elif col in EXPORT_NUMERIC_COLUMNS:
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+# Trả kèm csv_content trong kết quả /run_optimized_crawl (cleaner có thể đọc batch_url thay thế)
+INCLUDE_CSV_CONTENT = os.getenv('CRAWL_INCLUDE_CSV_CONTENT', 'true').lower() == 'true'
+# Số lượt crawl gần nhất giữ trong bộ nhớ cho /crawl_batches; batch cũ hơn được đọc lại từ file CSV
+CRAWL_BATCH_RETENTION = int(os.getenv('CRAWL_BATCH_RETENTION', '8'))
+# Số bản ghi mỗi lô khi stream NDJSON
+STREAM_CHUNK_ROWS = 500
+BATCH_ID_RE = re.compile(r'^[\w.-]+$')
+# Mặc định của /run_optimized_crawl: 'wait' (giữ kết nối đến khi crawl xong) hoặc 'queue' (trả run_id ngay)
+CRAWL_RUN_MODE = os.getenv('CRAWL_RUN_MODE', 'wait').lower()
+# Số lượt crawl đã xong giữ lại cho /crawl_runs
+CRAWL_RUN_RETENTION = int(os.getenv('CRAWL_RUN_RETENTION', '50'))
+# Giới hạn cache HTTP trên đĩa (data/http_cache): số entry tối đa và tuổi tối đa của một entry
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv('HTTP_CACHE_MAX_ENTRIES', '2000'))
+HTTP_CACHE_MAX_AGE_SECONDS = int(float(os.getenv('HTTP_CACHE_MAX_AGE_HOURS', '48')) * 3600)
+
+# Lịch chạy của main(): 'incremental' (chỉ crawl lại trạm đã đến hạn) hoặc 'hourly' (crawl tất cả lúc :00)
+CRAWL_SCHEDULE = os.getenv('CRAWL_SCHEDULE', 'incremental').lower()
+# Chu kỳ cập nhật ban đầu của từng nguồn (giây); sau đó ước lượng lại theo mốc đo của từng trạm
+SOURCE_UPDATE_INTERVAL = {
+    'iqair': 3600,
+    'waqi': 3600,
+    'openweathermap': 3600,
+}
+MAX_UPDATE_INTERVAL = 6 * 3600
+# Khoảng cách tối thiểu giữa hai lần hỏi một trạm, cũng là bước lùi đầu tiên khi trạm chưa có số liệu mới
+MIN_RECHECK_SECONDS = int(os.getenv('CRAWL_MIN_RECHECK_SECONDS', '600'))
+# Các trạm được rải đều trong cửa sổ này sau mốc cập nhật dự kiến thay vì dồn vào :00
+CRAWL_SPREAD_SECONDS = int(os.getenv('CRAWL_SPREAD_SECONDS', '1800'))
+
+
+class RateLimiter:
+    """Token bucket (dạng GCRA) thread-safe dùng chung cho mọi request tới một host"""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.interval = 60.0 / per_minute
+        self.tolerance = (max(burst, 1) - 1) * self.interval
+        self._tat = 0.0  # thời điểm "lý thuyết" request kế tiếp được phép (time.monotonic)
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Giữ chỗ một token, trả về số giây cần chờ trước khi gửi request"""
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tat, now)
+            self._tat = tat + self.interval
+            return max(0.0, tat - self.tolerance - now)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def penalize(self, seconds: float):
+        """Chặn mọi request mới trong `seconds` giây (dùng cho Retry-After)"""
+        with self._lock:
+            self._tat = max(self._tat, time.monotonic() + seconds + self.tolerance)
+
+
+def parse_retry_after(value: Optional[str], default: float = DEFAULT_RETRY_AFTER) -> float:
+    """Đọc header Retry-After (số giây hoặc HTTP-date)"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(pytz.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+def build_rate_limiters() -> Dict[str, RateLimiter]:
+    limiters = {}
+    for source, default in DEFAULT_RATE_LIMITS.items():
+        spec = os.getenv(f"{source.upper()}_RATE_LIMIT", default)
+        per_minute, _, burst = spec.partition(':')
+        limiters[source] = RateLimiter(float(per_minute), int(burst or 1))
+    return limiters
+
+
+# Dùng chung giữa mọi AirQualityCrawler và mọi thread để không vượt quota của provider
+RATE_LIMITERS = build_rate_limiters()
+
+
+def get_data_dir() -> Path:
+    """Thư mục dữ liệu: /app/data khi chạy Docker, ngược lại là data/ cạnh file này"""
+    docker_data_dir = Path("/app/data")
+    if docker_data_dir.exists():
+        data_folder = docker_data_dir
+    else:
+        data_folder = Path(__file__).parent / 'data'
+    data_folder.mkdir(exist_ok=True)
+    return data_folder
+
+
+def json_fingerprint(*path):
+    """Tạo hàm lấy mốc thời gian trạm trong payload JSON đã parse theo đường dẫn key/index"""
+    def fingerprint(value) -> Optional[str]:
+        for key in path:
+            try:
+                value = value[key]
+            except (KeyError, IndexError, TypeError):
+                return None
+        return None if value is None else str(value)
+    return fingerprint
+
+
+def reading_fingerprint(value) -> str:
+    """Fingerprint của số liệu đã trích xuất (gồm mốc cập nhật của trạm), cho trang HTML thay đổi ở mỗi lần tải"""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+IQAIR_STATION_TIME = json_fingerprint('data', 'current', 'pollution', 'ts')
+WAQI_STATION_TIME = json_fingerprint('data', 'time', 'iso')
+
+
+def parse_station_time(value) -> Optional[float]:
+    """
+    Chuyển mốc đo của trạm (epoch giây hoặc chuỗi ISO 8601) sang epoch giây.
+    Chuỗi không kèm múi giờ được hiểu là giờ Việt Nam; giá trị không đọc được trả về None.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        observed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if observed.tzinfo is None:
+        observed = pytz.timezone("Asia/Ho_Chi_Minh").localize(observed)
+    return observed.timestamp()
+
+
+def format_station_time(value, fmt: str = "%Y-%m-%d %H:%M:%S") -> Optional[str]:
+    """Mốc đo của trạm theo giờ Việt Nam, cùng định dạng với cột timestamp"""
+    observed = parse_station_time(value)
+    if observed is None:
+        return None
+    return datetime.fromtimestamp(observed, pytz.timezone("Asia/Ho_Chi_Minh")).strftime(fmt)
+
+
+# Thẻ mở có thể là phần tử cần lấy trên trang aqicn.org; thuộc tính được kiểm tra chính xác sau
+WAQI_TARGET_TAG_RE = re.compile(
+    r'<(div|span|td)\b([^>]*\b(?:aqiwgtvalue|aqiwgtutime|aqivalue|cur_(?:pm25|pm10|o3|no2|so2|co))\b[^>]*)>',
+    re.IGNORECASE
+)
+HTML_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))')
+HTML_IGNORED_TEXT_RE = re.compile(r'<!--.*?-->|<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+HTML_TAG_RE = re.compile(r'<[^>]*>')
+WAQI_POLLUTANTS = ['pm25', 'pm10', 'o3', 'no2', 'so2', 'co']
+# Mốc cập nhật của trạm trong div#aqiwgtutime, ví dụ "Updated on Saturday 14:00"
+WAQI_UPDATED_RE = re.compile(r'(?:\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\s+)?(\d{1,2}):(\d{2})',
+                             re.IGNORECASE)
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def _html_element_text(page: str, tag: str, start: int) -> str:
+    """Text của phần tử bắt đầu sau thẻ mở tại `start`, tính cả thẻ cùng tên lồng nhau"""
+    tag_re = re.compile(rf'<(/?){tag}\b[^>]*>', re.IGNORECASE)
+    depth = 1
+    end = len(page)
+    for match in tag_re.finditer(page, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            end = match.start()
+            break
+    return html.unescape(HTML_TAG_RE.sub('', page[start:end]))
+
+
+def extract_waqi_html_text(content) -> Dict[str, str]:
+    """
+    Quét một lượt trang aqicn.org bằng regex (không dựng cây DOM) và trả về text của
+    các phần tử cần dùng: 'aqi' theo thứ tự ưu tiên div#aqiwgtvalue > span.aqivalue >
+    div.aqivalue, từng pollutant trong td#cur_<pollutant> và 'updated' (mốc cập nhật của trạm)
+    trong div#aqiwgtutime. Giống BeautifulSoup.find, chỉ lấy phần tử đầu tiên của mỗi loại.
+    """
+    page = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
+    # Bỏ comment/script/style trước để không bắt nhầm HTML nằm trong chuỗi JavaScript
+    page = HTML_IGNORED_TEXT_RE.sub('', page)
+    aqi_candidates = {}
+    pollutant_elements = {}
+    updated_start = None
+    for match in WAQI_TARGET_TAG_RE.finditer(page):
+        tag = match.group(1).lower()
+        attrs = {}
+        for name, double_quoted, single_quoted, bare in HTML_ATTR_RE.findall(match.group(2)):
+            attrs.setdefault(name.lower(), double_quoted or single_quoted or bare)
+        element_id = attrs.get('id')
+        classes = attrs.get('class', '').split()
+        if tag == 'div' and element_id == 'aqiwgtvalue':
+            aqi_candidates.setdefault(0, (tag, match.end()))
+        elif tag == 'span' and 'aqivalue' in classes:
+            aqi_candidates.setdefault(1, (tag, match.end()))
+        elif tag == 'div' and 'aqivalue' in classes:
+            aqi_candidates.setdefault(2, (tag, match.end()))
+        elif tag == 'div' and element_id == 'aqiwgtutime' and updated_start is None:
+            updated_start = match.end()
+        elif tag == 'td' and element_id and element_id.startswith('cur_') and element_id[4:] in WAQI_POLLUTANTS:
+            pollutant_elements.setdefault(element_id[4:], match.end())
+
+    texts = {}
+    if aqi_candidates:
+        tag, start = aqi_candidates[min(aqi_candidates)]
+        texts['aqi'] = _html_element_text(page, tag, start)
+    for pollutant in WAQI_POLLUTANTS:
+        if pollutant in pollutant_elements:
+            texts[pollutant] = _html_element_text(page, 'td', pollutant_elements[pollutant])
+    if updated_start is not None:
+        texts['updated'] = _html_element_text(page, 'div', updated_start)
+    return texts
+
+
+def parse_waqi_update_time(text: Optional[str], now: datetime = None) -> Optional[str]:
+    """
+    Mốc cập nhật trên trang aqicn.org ("Updated on Saturday 14:00", giờ địa phương của trạm)
+    theo định dạng cột timestamp: lần gần nhất không sau now khớp thứ và giờ; None nếu không đọc được.
+    """
+    match = WAQI_UPDATED_RE.search(text or '')
+    if not match:
+        return None
+    weekday, hour, minute = match.groups()
+    if int(hour) > 23 or int(minute) > 59:
+        return None
+    now = now or datetime.now(pytz.timezone("Asia/Ho_Chi_Minh"))
+    observed = now.replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
+    if weekday:
+        observed -= timedelta(days=(observed.weekday() - WEEKDAYS.index(weekday.lower())) % 7)
+    if observed > now:
+        observed -= timedelta(days=7 if weekday else 1)
+    return observed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class HttpResponseCache:
+    """Cache response trên đĩa theo URL (ETag/Last-Modified, fingerprint số liệu và payload đã parse)"""
+
+    def __init__(self, cache_dir: Path, max_entries: int = HTTP_CACHE_MAX_ENTRIES,
+                 max_age: float = HTTP_CACHE_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, max_entries)
+        self.max_age = max_age
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stores = 0
+        self.reset_stats()
+        self.prune()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.not_modified = 0
+            self.unchanged = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'unchanged': self.unchanged,
+                'hit_ratio': round(self.hits / total, 3) if total else 0.0
+            }
+
+    @staticmethod
+    def make_key(url: str, params: Dict = None) -> str:
+        raw = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, url: str, params: Dict = None):
+        """Trả về (key, entry đã lưu hoặc None, header conditional request)"""
+        key = self.make_key(url, params)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            try:
+                entry = json.loads((self.cache_dir / f"{key}.json").read_text(encoding='utf-8'))
+                with self._lock:
+                    self._entries[key] = entry
+            except (OSError, ValueError):
+                entry = None
+        if entry is not None and time.time() - entry.get('stored_at', 0) > self.max_age:
+            entry = None
+
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return key, entry, headers
+
+    def resolve(self, key: str, entry: Optional[Dict], status: int, headers, body: bytes, parse, fingerprint=None):
+        """
+        Trả về (200, payload) cho số liệu mới và (304, payload đã lưu) khi server trả 304 hoặc
+        fingerprint (mốc thời gian trạm, mặc định là chính số liệu) không đổi.
+        """
+        if status == 304 and entry is not None:
+            with self._lock:
+                self.hits += 1
+                self.not_modified += 1
+            return 304, entry['value']
+        if status != 200:
+            return status, None
+
+        value = parse(body)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return 200, None
+        station_time = fingerprint(value) if fingerprint else None
+        if station_time is None:
+            station_time = reading_fingerprint(value)
+        unchanged = entry is not None and entry.get('fingerprint') == station_time
+        with self._lock:
+            if unchanged:
+                self.hits += 1
+                self.unchanged += 1
+            else:
+                self.misses += 1
+        # Entry số liệu không đổi cũng được ghi lại để không hết hạn khi trạm đứng yên
+        self._store(key, {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fingerprint': station_time,
+            'stored_at': time.time(),
+            'value': value
+        })
+        return (304, value) if unchanged else (200, value)
+
+    def _store(self, key: str, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._stores += 1
+            # Dọn thư mục sau mỗi max_entries/10 lần ghi
+            prune = self._stores % max(1, self.max_entries // 10) == 0
+        path = self.cache_dir / f"{key}.json"
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug(f"Could not persist HTTP cache entry {key}: {str(e)}")
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Xóa entry quá max_age và các entry cũ nhất vượt max_entries; trả về số entry đã xóa"""
+        files = []
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        files.sort(reverse=True)
+        cutoff = time.time() - self.max_age
+        expired = [path for position, (mtime, path) in enumerate(files)
+                   if position >= self.max_entries or mtime < cutoff]
+        for path in expired:
+            with self._lock:
+                self._entries.pop(path.stem, None)
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        return len(expired)
+
+
+class CrawlBatchStore:
+    """Giữ DataFrame export của các lượt crawl gần nhất theo batch_id (LRU)"""
+
+    def __init__(self, max_batches: int):
+        self.max_batches = max(1, max_batches)
+        self._batches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, batch_id: str, df: pd.DataFrame):
+        with self._lock:
+            self._batches[batch_id] = df
+            self._batches.move_to_end(batch_id)
+            while len(self._batches) > self.max_batches:
+                self._batches.popitem(last=False)
+
+    def get(self, batch_id: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+
+CRAWL_BATCHES = CrawlBatchStore(CRAWL_BATCH_RETENTION)
+
+
+def open_crawl_batch(batch_id: str):
+    """
+    Các lô DataFrame (tối đa STREAM_CHUNK_ROWS dòng) của một lượt crawl, None nếu không tìm thấy.
+    batch_id là tên file CSV export không kèm đuôi, nên batch do process khác tạo vẫn đọc được từ đĩa.
+    """
+    if not BATCH_ID_RE.match(batch_id):
+        return None
+    df = CRAWL_BATCHES.get(batch_id)
+    if df is not None:
+        return (df.iloc[start:start + STREAM_CHUNK_ROWS] for start in range(0, len(df), STREAM_CHUNK_ROWS))
+    csv_path = get_data_dir() / 'data_export' / f"{batch_id}.csv"
+    if csv_path.is_file():
+        return pd.read_csv(csv_path, chunksize=STREAM_CHUNK_ROWS, encoding='utf-8-sig')
+    parquet_paths = sorted((get_data_dir() / 'data_export_parquet').glob(f"date=*/{batch_id}.parquet"))
+    if parquet_paths and pa is not None:
+        return (_parquet_batch_frame(batch) for path in parquet_paths
+                for batch in pq.ParquetFile(path).iter_batches(batch_size=STREAM_CHUNK_ROWS))
+    return None
+
+
+def _parquet_batch_frame(batch) -> pd.DataFrame:
+    """Một record batch Parquet dưới dạng DataFrame, thời gian định dạng giống file CSV"""
+    df = batch.to_pandas()
+    for col in ('timestamp', 'observed_at'):
+        if col in df.columns:
+            df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df
+
+
+class StationFreshness:
+    """
+    Trạng thái cập nhật của từng (nguồn, thành phố) lưu trong một file JSON: mốc đo gần nhất,
+    lần hỏi gần nhất, chu kỳ cập nhật ước lượng và số lần liên tiếp chưa có số liệu mới.
+    Scheduler dùng next_due để chỉ crawl lại trạm đã đến hạn.
+    """
+
+    def __init__(self, path: Path, spread_seconds: int = CRAWL_SPREAD_SECONDS):
+        self.path = path
+        self.spread_seconds = max(1, int(spread_seconds))
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            return json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def make_key(source: str, city_name: str) -> str:
+        return f"{source}|{city_name}"
+
+    def offset(self, key: str) -> int:
+        """Độ lệch cố định của trạm trong cửa sổ rải request (ổn định giữa các lần chạy)"""
+        return zlib.crc32(key.encode('utf-8')) % self.spread_seconds
+
+    def next_due(self, source: str, city_name: str) -> float:
+        """Thời điểm (epoch) nên hỏi lại trạm; 0 nếu chưa từng crawl"""
+        key = self.make_key(source, city_name)
+        with self._lock:
+            entry = self._state.get(key)
+        if not entry:
+            return 0.0
+        if entry['misses']:
+            # Chưa có số liệu mới sau mốc dự kiến: hỏi lại thưa dần, tối đa một chu kỳ
+            backoff = MIN_RECHECK_SECONDS * 2 ** (entry['misses'] - 1)
+            return entry['checked'] + min(entry['interval'], backoff)
+        expected = entry['observed'] + entry['interval'] + self.offset(key)
+        return max(expected, entry['checked'] + MIN_RECHECK_SECONDS)
+
+    def due_cities(self, source: str, cities: List[Dict], now: float = None) -> List[Dict]:
+        now = time.time() if now is None else now
+        return [city for city in cities if self.next_due(source, city['name']) <= now]
+
+    def update(self, source: str, cities: List[Dict], records: List[Dict], now: float = None):
+        """Ghi nhận kết quả một lượt crawl của nguồn cho các thành phố đã hỏi"""
+        now = time.time() if now is None else now
+        observed_by_city = {record['city']: parse_station_time(record.get('observed_at')) for record in records}
+        with self._lock:
+            for city in cities:
+                key = self.make_key(source, city['name'])
+                entry = self._state.get(key) or {
+                    'observed': None,
+                    'checked': 0.0,
+                    'interval': SOURCE_UPDATE_INTERVAL[source],
+                    'misses': 0,
+                }
+                entry['checked'] = now
+                if city['name'] not in observed_by_city:
+                    entry['misses'] += 1
+                    self._state[key] = entry
+                    continue
+
+                observed = observed_by_city[city['name']]
+                if observed is None:
+                    # Nguồn không có mốc đo (trang aqicn.org): coi như cập nhật ở đầu chu kỳ hiện tại
+                    observed = now - now % entry['interval']
+                previous = entry['observed']
+                if previous is not None and observed <= previous:
+                    entry['misses'] += 1
+                else:
+                    if previous is not None:
+                        # Học dần chu kỳ thật của trạm; một khoảng trống dài chỉ kéo giãn tối đa gấp đôi
+                        delta = min(observed - previous, 2 * entry['interval'])
+                        interval = 0.5 * entry['interval'] + 0.5 * delta
+                        entry['interval'] = min(max(interval, MIN_RECHECK_SECONDS), MAX_UPDATE_INTERVAL)
+                    entry['observed'] = observed
+                    entry['misses'] = 0
+                self._state[key] = entry
+
+    def save(self):
+        with self._lock:
+            payload = json.dumps(self._state, ensure_ascii=False, indent=2)
+        tmp_path = self.path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_text(payload, encoding='utf-8')
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist station freshness state: {str(e)}")
+
+
 class AirQualityCrawler:
-    def __init__(self):
+    def __init__(self, city_workers: Dict[str, int] = None, include_csv_content: bool = INCLUDE_CSV_CONTENT):
+        # Số thread crawl song song theo thành phố cho từng nguồn
+        self.city_workers = {**SOURCE_CONCURRENCY, **(city_workers or {})}
+        self.include_csv_content = include_csv_content
         self.session = requests.Session()
+        # Đủ connection cho mọi thread (OpenWeatherMap dùng 2 connection/thành phố)
+        adapter = HTTPAdapter(pool_connections=len(DEFAULT_RATE_LIMITS),
+                              pool_maxsize=2 * max(self.city_workers.values()))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.http_cache = HttpResponseCache(get_data_dir() / 'http_cache')
+        self.freshness = StationFreshness(get_data_dir() / 'station_freshness.json')
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -93,6 +733,49 @@ class AirQualityCrawler:
         })
         self.all_data = []
 
+    def _back_off(self, source: str, limiter: RateLimiter, retry_after: Optional[str]):
+        delay = parse_retry_after(retry_after)
+        logger.warning(f"{source} rate limit reached (429). Pausing {source} requests for {delay:.0f}s")
+        limiter.penalize(delay)
+
+    def _get(self, source: str, url: str, **kwargs) -> requests.Response:
+        """GET qua rate limiter của nguồn; khi gặp 429 limiter sẽ lùi theo Retry-After"""
+        limiter = RATE_LIMITERS[source]
+        limiter.acquire()
+        response = self.session.get(url, **kwargs)
+        if response.status_code == 429:
+            self._back_off(source, limiter, response.headers.get('Retry-After'))
+        return response
+
+    def _crawl_cities(self, source: str, crawl_city, cities: List[Dict]) -> List[Dict]:
+        """
+        Chạy crawl_city cho từng thành phố trên một pool thread giới hạn theo nguồn.
+        Kết quả giữ đúng thứ tự danh sách thành phố, bỏ qua thành phố lỗi/không có dữ liệu.
+        """
+        if not cities:
+            return []
+        workers = max(1, min(self.city_workers[source], len(cities)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{source}-city") as executor:
+            futures = [executor.submit(crawl_city, city) for city in cities]
+            results = []
+            for city, future in zip(cities, futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.debug(f"{source} thread error for {city['name']}: {str(e)}")
+                    continue
+                if result:
+                    results.append(result)
+        return results
+
+    def _cached_get(self, source: str, url: str, parse, fingerprint=None, params: Dict = None,
+                    headers: Dict = None, timeout: int = 30):
+        """GET có điều kiện qua self.http_cache; số liệu giống lần trước trả về (304, payload đã lưu)"""
+        key, entry, conditional = self.http_cache.lookup(url, params)
+        response = self._get(source, url, params=params, headers={**(headers or {}), **conditional}, timeout=timeout)
+        return self.http_cache.resolve(key, entry, response.status_code, response.headers, response.content,
+                                       parse, fingerprint)
+
     def check_connectivity(self) -> bool:
         """Kiểm tra kết nối mạng trước khi crawl"""
         try:
@@ -171,248 +854,310 @@ class AirQualityCrawler:
         ]
 
     def extract_number(self, text: str) -> Optional[float]:
-        """Cải thiện trích xuất số từ chuỗi text"""
-        if not text:
+        """Trích xuất số đầu tiên trong chuỗi text (xem common.numeric.parse_number)"""
+        return parse_number(text)
+
+    def _base_record(self, city: Dict) -> Dict:
+        """Các trường chung của một bản ghi cho thành phố"""
+        return {
+            'timestamp': get_vietnam_time_str(),
+            'city': city['name'],
+            'province': city['province'],
+            'latitude': city['lat'],
+            'longitude': city['lon'],
+        }
+
+    def _build_iqair_record(self, city: Dict, current: Dict) -> Dict:
+        """Tạo bản ghi từ trường `current` của IQAir API"""
+        pollution = current.get('pollution', {})
+        weather = current.get('weather', {})
+        record = self._base_record(city)
+        record.update({
+            'aqi': pollution.get('aqius'),
+            'aqi_cn': pollution.get('aqicn'),
+            'pm25': pollution.get('p2', {}).get('conc') if pollution.get('p2') else None,
+            'pm10': pollution.get('p1', {}).get('conc') if pollution.get('p1') else None,
+            'o3': pollution.get('o3', {}).get('conc') if pollution.get('o3') else None,
+            'no2': pollution.get('n2', {}).get('conc') if pollution.get('n2') else None,
+            'so2': pollution.get('s2', {}).get('conc') if pollution.get('s2') else None,
+            'co': pollution.get('co', {}).get('conc') if pollution.get('co') else None,
+            'temperature': weather.get('tp'),
+            'humidity': weather.get('hu'),
+            'pressure': weather.get('pr'),
+            'wind_speed': weather.get('ws'),
+            'wind_direction': weather.get('wd'),
+            'visibility': weather.get('vv'),
+            'uv_index': weather.get('uvi'),
+            'source': 'iqair',
+            'raw_data': json.dumps(current, ensure_ascii=False)
+        })
+        record['observed_at'] = format_station_time(pollution.get('ts'))
+        return record
+
+    def _build_waqi_api_record(self, city: Dict, data_json: Dict) -> Optional[Dict]:
+        """Tạo bản ghi từ response JSON của WAQI API, None nếu không có AQI"""
+        if data_json.get('status') != 'ok' or not data_json.get('data'):
             return None
-        
-        # Làm sạch text
-        text = str(text).strip()
-        # Loại bỏ các ký tự không cần thiết
-        text = re.sub(r'[^\d.,\-\s]', '', text)
-        text = text.replace(',', '.').strip()
-        
-        # Các pattern để tìm số
-        patterns = [
-            r'(\d+\.?\d*)',
-            r'(\d+)',
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            if matches:
-                try:
-                    return float(matches[0])
-                except (ValueError, IndexError):
-                    continue
+        aqi = data_json['data'].get('aqi')
+        if not aqi or aqi == '-':
+            return None
+        iaqi = data_json['data'].get('iaqi', {})
+        record = self._base_record(city)
+        record.update({
+            'aqi': aqi if isinstance(aqi, (int, float)) else None,
+            'pm25': iaqi.get('pm25', {}).get('v'),
+            'pm10': iaqi.get('pm10', {}).get('v'),
+            'o3': iaqi.get('o3', {}).get('v'),
+            'no2': iaqi.get('no2', {}).get('v'),
+            'so2': iaqi.get('so2', {}).get('v'),
+            'co': iaqi.get('co', {}).get('v'),
+            'source': 'waqi',
+            'status': 'success',
+            'raw_data': json.dumps(data_json['data'], ensure_ascii=False)
+        })
+        record['observed_at'] = format_station_time(data_json['data'].get('time', {}).get('iso'))
+        return record
+
+    def _extract_waqi_html(self, content: bytes) -> Optional[Dict]:
+        """
+        Lấy AQI, các pollutant và mốc cập nhật của trạm ('updated', nếu có) từ trang aqicn.org,
+        None nếu không tìm thấy AQI
+        """
+        texts = extract_waqi_html_text(content)
+
+        aqi_text = texts.pop('aqi', '').strip()
+        if not aqi_text:
+            return None
+        aqi_value = self.extract_number(aqi_text)
+        if not aqi_value:
+            return None
+
+        updated = texts.pop('updated', '').strip()
+        pollutants = {pollutant: self.extract_number(text) for pollutant, text in texts.items()}
+        values = {'aqi': aqi_value, **pollutants}
+        if updated:
+            values['updated'] = updated
+        return values
+
+    def _build_waqi_web_record(self, city: Dict, values: Dict) -> Dict:
+        """Tạo bản ghi từ giá trị lấy được trên trang aqicn.org"""
+        record = self._base_record(city)
+        record.update({
+            'aqi': values['aqi'],
+            'pm25': values.get('pm25'),
+            'pm10': values.get('pm10'),
+            'o3': values.get('o3'),
+            'no2': values.get('no2'),
+            'so2': values.get('so2'),
+            'co': values.get('co'),
+            'source': 'waqi',
+            'status': 'success'
+        })
+        record['observed_at'] = parse_waqi_update_time(values.get('updated'))
+        return record
+
+    def _build_openweather_record(self, city: Dict, air_data: Optional[Dict], weather_data: Optional[Dict]) -> Optional[Dict]:
+        """Gộp response air_pollution và weather của OpenWeatherMap, None nếu không có dữ liệu hữu ích"""
+        record = self._base_record(city)
+        record['source'] = 'openweathermap'
+        observed_at = weather_data.get('dt') if weather_data is not None else None
+        if air_data and 'list' in air_data and air_data['list']:
+            current = air_data['list'][0]
+            observed_at = current.get('dt', observed_at)
+            main = current.get('main', {})
+            components = current.get('components', {})
+            record.update({
+                'aqi': main.get('aqi'),
+                'pm25': components.get('pm2_5'),
+                'pm10': components.get('pm10'),
+                'o3': components.get('o3'),
+                'no2': components.get('no2'),
+                'so2': components.get('so2'),
+                'co': components.get('co'),
+                'nh3': components.get('nh3'),
+            })
+        if weather_data is not None:
+            main_weather = weather_data.get('main', {})
+            wind_weather = weather_data.get('wind', {})
+            record.update({
+                'temperature': main_weather.get('temp'),
+                'humidity': main_weather.get('humidity'),
+                'pressure': main_weather.get('pressure'),
+                'wind_speed': wind_weather.get('speed'),
+                'wind_direction': wind_weather.get('deg'),
+                'visibility': weather_data.get('visibility'),
+                'weather_condition': weather_data.get('weather', [{}])[0].get('main') if weather_data.get('weather') else None
+            })
+        record['observed_at'] = format_station_time(observed_at)
+
+        # Chỉ trả về record nếu có ít nhất một số dữ liệu hữu ích
+        if any(record.get(key) is not None for key in ['aqi', 'pm25', 'pm10', 'temperature']):
+            return record
         return None
 
-    def crawl_iqair_data(self, api_key: str) -> List[Dict]:
+    def _web_headers(self) -> Dict:
+        """Header giả lập trình duyệt cho các request scraping"""
+        return {
+            'User-Agent': random.choice(self.user_agents),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        }
+
+    def _iqair_endpoints(self, city: Dict, name: str, api_key: str) -> List[Dict]:
+        """Các endpoint IQAir thử lần lượt cho một tên thành phố"""
+        return [
+            {
+                'url': "https://api.airvisual.com/v2/city",
+                'params': {
+                    'city': name,
+                    'state': city['province'],
+                    'country': 'Vietnam',
+                    'key': api_key
+                }
+            },
+            {
+                'url': "https://api.airvisual.com/v2/nearest_city",
+                'params': {
+                    'lat': city['lat'],
+                    'lon': city['lon'],
+                    'key': api_key
+                }
+            }
+        ]
+
+    def _waqi_api_urls(self, city: Dict, token: str) -> List[str]:
+        """Các URL WAQI API thử lần lượt cho một thành phố"""
+        return [
+            f"https://api.waqi.info/feed/geo:{city['lat']};{city['lon']}/?token={token}",
+            f"https://api.waqi.info/feed/{city['name'].lower().replace(' ', '-')}/?token={token}",
+        ]
+
+    def _waqi_web_urls(self, city: Dict) -> List[str]:
+        """Các trang aqicn.org dùng khi WAQI API không có dữ liệu"""
+        return [
+            f"https://aqicn.org/city/{city['name'].lower().replace(' ', '-')}",
+            f"https://aqicn.org/city/vietnam/{city['name'].lower().replace(' ', '-')}",
+        ]
+
+    def _openweather_endpoints(self, city: Dict, api_key: str) -> List[Dict]:
+        """Endpoint air_pollution và weather của OpenWeatherMap cho một thành phố"""
+        return [
+            {
+                'url': "http://api.openweathermap.org/data/2.5/air_pollution",
+                'params': {'lat': city['lat'], 'lon': city['lon'], 'appid': api_key},
+                'station_time': json_fingerprint('list', 0, 'dt')
+            },
+            {
+                'url': "http://api.openweathermap.org/data/2.5/weather",
+                'params': {'lat': city['lat'], 'lon': city['lon'], 'appid': api_key, 'units': 'metric'},
+                'station_time': json_fingerprint('dt')
+            }
+        ]
+
+    def crawl_iqair_data(self, api_key: str, cities: List[Dict] = None) -> List[Dict]:
         """Crawl dữ liệu từ IQAir API với cải thiện xử lý lỗi"""
         if not api_key:
             logger.warning("IQAir API key not provided, skipping IQAir crawling")
             return []
             
         logger.info("Starting IQAir data crawling...")
-        data = []
-        cities = self.get_vietnam_cities()
+        cities = self.get_vietnam_cities() if cities is None else cities
         
         def crawl_city(city):
             names_to_try = [city['name']] + city.get('alt_names', [])
             for name in names_to_try:
                 try:
-                    endpoints = [
-                        {
-                            'url': "https://api.airvisual.com/v2/city",
-                            'params': {
-                                'city': name,
-                                'state': city['province'],
-                                'country': 'Vietnam',
-                                'key': api_key
-                            }
-                        },
-                        {
-                            'url': "https://api.airvisual.com/v2/nearest_city",
-                            'params': {
-                                'lat': city['lat'],
-                                'lon': city['lon'],
-                                'key': api_key
-                            }
-                        }
-                    ]
+                    endpoints = self._iqair_endpoints(city, name, api_key)
                     
                     for endpoint in endpoints:
                         try:
-                            response = self.session.get(endpoint['url'], params=endpoint['params'], timeout=30)
-                            if response.status_code == 200:
-                                json_data = response.json()
+                            status, json_data = self._cached_get('iqair', endpoint['url'], json.loads, IQAIR_STATION_TIME,
+                                                                 params=endpoint['params'], timeout=30)
+                            if status == 200:
                                 if json_data.get('status') == 'success' and json_data.get('data'):
-                                    current = json_data['data']['current']
-                                    pollution = current.get('pollution', {})
-                                    weather = current.get('weather', {})
-                                    record = {
-                                        'timestamp': get_vietnam_time_str(),
-                                        'city': city['name'],
-                                        'province': city['province'],
-                                        'latitude': city['lat'],
-                                        'longitude': city['lon'],
-                                        'aqi': pollution.get('aqius'),
-                                        'aqi_cn': pollution.get('aqicn'),
-                                        'pm25': pollution.get('p2', {}).get('conc') if pollution.get('p2') else None,
-                                        'pm10': pollution.get('p1', {}).get('conc') if pollution.get('p1') else None,
-                                        'o3': pollution.get('o3', {}).get('conc') if pollution.get('o3') else None,
-                                        'no2': pollution.get('n2', {}).get('conc') if pollution.get('n2') else None,
-                                        'so2': pollution.get('s2', {}).get('conc') if pollution.get('s2') else None,
-                                        'co': pollution.get('co', {}).get('conc') if pollution.get('co') else None,
-                                        'temperature': weather.get('tp'),
-                                        'humidity': weather.get('hu'),
-                                        'pressure': weather.get('pr'),
-                                        'wind_speed': weather.get('ws'),
-                                        'wind_direction': weather.get('wd'),
-                                        'visibility': weather.get('vv'),
-                                        'uv_index': weather.get('uvi'),
-                                        'source': 'iqair',
-                                        'raw_data': json.dumps(current, ensure_ascii=False)
-                                    }
+                                    record = self._build_iqair_record(city, json_data['data']['current'])
                                     logger.info(f"{SUCCESS_MARK} IQAir data crawled for {city['name']}")
                                     return record
-                            elif response.status_code == 429:
-                                logger.warning(f"IQAir API rate limit reached for {city['name']}. Waiting 60 seconds...")
-                                time.sleep(60)
+                            elif status == 304:
+                                # Trạm chưa cập nhật từ lượt trước: không phát lại số liệu cũ
+                                logger.info(f"IQAir reading for {city['name']} unchanged, skipping")
+                                return None
+                            elif status == 429:
+                                # Limiter đã lùi theo Retry-After, request kế tiếp sẽ tự chờ
                                 continue
-                            elif response.status_code == 401:
+                            elif status == 401:
                                 logger.error(f"IQAir API key invalid for {city['name']}. Check your API key.")
                                 return None
                             else:
-                                logger.debug(f"IQAir request failed for {city['name']}. Status code: {response.status_code}")
+                                logger.debug(f"IQAir request failed for {city['name']}. Status code: {status}")
                         except requests.exceptions.RequestException as e:
                             logger.debug(f"IQAir network error for {city['name']}: {str(e)}")
                             continue
                         except Exception as e:
                             logger.debug(f"IQAir unexpected error for {city['name']}: {str(e)}")
                             continue
-                        time.sleep(1)
                 except Exception as e:
                     logger.debug(f"Error processing {city['name']}: {str(e)}")
                     continue
             return None
         
-        # Sử dụng ThreadPoolExecutor với số lượng worker hạn chế
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            future_to_city = {executor.submit(crawl_city, city): city for city in cities}
-            for future in as_completed(future_to_city):
-                try:
-                    result = future.result(timeout=60)
-                    if result:
-                        data.append(result)
-                except Exception as e:
-                    logger.debug(f"Thread execution error: {str(e)}")
-                    continue
+        data = self._crawl_cities('iqair', crawl_city, cities)
         
         logger.info(f"IQAir crawling completed. Retrieved {len(data)} records")
         return data
 
-    def crawl_waqi_data(self, token: str = 'demo') -> List[Dict]:
+    def crawl_waqi_data(self, token: str = 'demo', cities: List[Dict] = None) -> List[Dict]:
         """Crawl WAQI với cải thiện và xử lý lỗi tốt hơn"""
         logger.info("Starting WAQI data crawling...")
-        data = []
-        cities = self.get_vietnam_cities()
+        cities = self.get_vietnam_cities() if cities is None else cities
+        # Thành phố có số liệu chưa đổi từ lượt trước (không phát lại, không retry)
+        unchanged = set()
         
         def get_city_data(city: Dict) -> Optional[Dict]:
             """Get WAQI data for a city using multiple methods"""
             try:
                 # Method 1: API với token
                 if token and token != 'demo':
-                    api_urls = [
-                        f"https://api.waqi.info/feed/geo:{city['lat']};{city['lon']}/?token={token}",
-                        f"https://api.waqi.info/feed/{city['name'].lower().replace(' ', '-')}/?token={token}",
-                    ]
+                    api_urls = self._waqi_api_urls(city, token)
                     
                     for url in api_urls:
                         try:
-                            response = self.session.get(url, timeout=20)
-                            if response.status_code == 200:
-                                data_json = response.json()
-                                if data_json.get('status') == 'ok' and data_json.get('data'):
-                                    aqi = data_json['data'].get('aqi')
-                                    if aqi and aqi != '-':
-                                        iaqi = data_json['data'].get('iaqi', {})
-                                        record = {
-                                            'timestamp': get_vietnam_time_str(),
-                                            'city': city['name'],
-                                            'province': city['province'],
-                                            'latitude': city['lat'],
-                                            'longitude': city['lon'],
-                                            'aqi': aqi if isinstance(aqi, (int, float)) else None,
-                                            'pm25': iaqi.get('pm25', {}).get('v'),
-                                            'pm10': iaqi.get('pm10', {}).get('v'),
-                                            'o3': iaqi.get('o3', {}).get('v'),
-                                            'no2': iaqi.get('no2', {}).get('v'),
-                                            'so2': iaqi.get('so2', {}).get('v'),
-                                            'co': iaqi.get('co', {}).get('v'),
-                                            'source': 'waqi',
-                                            'status': 'success',
-                                            'raw_data': json.dumps(data_json['data'], ensure_ascii=False)
-                                        }
-                                        logger.info(f"{SUCCESS_MARK} WAQI API data crawled for {city['name']}")
-                                        return record
+                            status, data_json = self._cached_get('waqi', url, json.loads, WAQI_STATION_TIME, timeout=20)
+                            if status == 304:
+                                logger.info(f"WAQI API reading for {city['name']} unchanged, skipping")
+                                unchanged.add(city['name'])
+                                return None
+                            if status == 200:
+                                record = self._build_waqi_api_record(city, data_json)
+                                if record:
+                                    logger.info(f"{SUCCESS_MARK} WAQI API data crawled for {city['name']}")
+                                    return record
                         except Exception as e:
                             logger.debug(f"WAQI API error for {city['name']}: {str(e)}")
                             continue
-                        time.sleep(0.5)
                 
                 # Method 2: Web scraping
-                web_urls = [
-                    f"https://aqicn.org/city/{city['name'].lower().replace(' ', '-')}",
-                    f"https://aqicn.org/city/vietnam/{city['name'].lower().replace(' ', '-')}",
-                ]
+                web_urls = self._waqi_web_urls(city)
                 
-                headers = {
-                    'User-Agent': random.choice(self.user_agents),
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                    'Accept-Encoding': 'gzip, deflate',
-                    'Connection': 'keep-alive',
-                }
+                headers = self._web_headers()
                 
                 for web_url in web_urls:
                     try:
-                        response = self.session.get(web_url, headers=headers, timeout=20)
-                        if response.status_code == 200:
-                            soup = BeautifulSoup(response.content, 'html.parser')
-                            
-                            # Tìm AQI value
-                            aqi_elem = soup.find('div', {'id': 'aqiwgtvalue'})
-                            if not aqi_elem:
-                                aqi_elem = soup.find('span', class_='aqivalue')
-                            if not aqi_elem:
-                                aqi_elem = soup.find('div', class_='aqivalue')
-                            
-                            if aqi_elem and aqi_elem.text.strip():
-                                aqi_text = aqi_elem.text.strip()
-                                aqi_value = self.extract_number(aqi_text)
-                                
-                                if aqi_value:
-                                    # Tìm các pollutant values
-                                    pollutants = {}
-                                    pollutant_ids = ['pm25', 'pm10', 'o3', 'no2', 'so2', 'co']
-                                    
-                                    for pollutant in pollutant_ids:
-                                        elem = soup.find('td', {'id': f'cur_{pollutant}'})
-                                        if elem:
-                                            pollutants[pollutant] = self.extract_number(elem.text)
-                                    
-                                    record = {
-                                        'timestamp': get_vietnam_time_str(),
-                                        'city': city['name'],
-                                        'province': city['province'],
-                                        'latitude': city['lat'],
-                                        'longitude': city['lon'],
-                                        'aqi': aqi_value,
-                                        'pm25': pollutants.get('pm25'),
-                                        'pm10': pollutants.get('pm10'),
-                                        'o3': pollutants.get('o3'),
-                                        'no2': pollutants.get('no2'),
-                                        'so2': pollutants.get('so2'),
-                                        'co': pollutants.get('co'),
-                                        'source': 'waqi',
-                                        'status': 'success'
-                                    }
-                                    logger.info(f"{SUCCESS_MARK} WAQI web data crawled for {city['name']}")
-                                    return record
+                        status, values = self._cached_get('waqi_web', web_url, self._extract_waqi_html,
+                                                          headers=headers, timeout=20)
+                        if status == 304:
+                            logger.info(f"WAQI web reading for {city['name']} unchanged, skipping")
+                            unchanged.add(city['name'])
+                            return None
+                        if status == 200 and values:
+                            record = self._build_waqi_web_record(city, values)
+                            logger.info(f"{SUCCESS_MARK} WAQI web data crawled for {city['name']}")
+                            return record
                     except Exception as e:
                         logger.debug(f"WAQI web scraping error for {city['name']}: {str(e)}")
                         continue
-                    time.sleep(1)
                 
                 logger.debug(f"{FAIL_MARK} Could not crawl WAQI data for {city['name']}")
                 return None
@@ -421,136 +1166,247 @@ class AirQualityCrawler:
                 logger.debug(f"{FAIL_MARK} Error crawling WAQI data for {city['name']}: {str(e)}")
                 return None
 
-        # Crawl từng thành phố với retry logic
-        for city in cities:
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    result = get_city_data(city)
-                    if result:
-                        data.append(result)
-                        break
-                    elif attempt < max_retries - 1:
-                        time.sleep(2)
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        logger.debug(f"Failed all retries for {city['name']}: {str(e)}")
-                    time.sleep(2)
+        def crawl_city_with_retry(city: Dict) -> Optional[Dict]:
+            # Nhịp giữa các lần thử do rate limiter (và Retry-After) quyết định
+            for _ in range(WAQI_CITY_ATTEMPTS):
+                result = get_city_data(city)
+                if result or city['name'] in unchanged:
+                    return result
+            logger.debug(f"Failed all retries for {city['name']}")
+            return None
+
+        data = self._crawl_cities('waqi', crawl_city_with_retry, cities)
         
         logger.info(f"WAQI crawling completed. Retrieved {len(data)} records")
         return data
 
-    def crawl_openweather_data(self, api_key: str) -> List[Dict]:
+    def crawl_openweather_data(self, api_key: str, cities: List[Dict] = None) -> List[Dict]:
         """Crawl OpenWeatherMap với cải thiện xử lý lỗi"""
         if not api_key:
             logger.warning("OpenWeatherMap API key not provided, skipping OpenWeatherMap crawling")
             return []
             
         logger.info("Starting OpenWeatherMap data crawling...")
-        data = []
-        cities = self.get_vietnam_cities()
+        cities = self.get_vietnam_cities() if cities is None else cities
+        
+        def fetch_json(endpoint: Dict, label: str, city: Dict):
+            """Trả về (status_code, json) của một endpoint OpenWeatherMap; 304 kèm json đã lưu"""
+            try:
+                status, payload = self._cached_get('openweathermap', endpoint['url'], json.loads, endpoint['station_time'],
+                                                   params=endpoint['params'], timeout=30)
+                if status in (200, 304):
+                    return status, payload
+                logger.debug(f"OpenWeatherMap {label} API failed for {city['name']}: {status}")
+                return status, None
+            except Exception as e:
+                logger.debug(f"OpenWeatherMap {label} error for {city['name']}: {str(e)}")
+                return None, None
         
         def crawl_city_openweather(city):
             try:
-                air_url = "http://api.openweathermap.org/data/2.5/air_pollution"
-                weather_url = "http://api.openweathermap.org/data/2.5/weather"
-                
-                air_params = {
-                    'lat': city['lat'],
-                    'lon': city['lon'],
-                    'appid': api_key
-                }
-                
-                weather_params = {
-                    'lat': city['lat'],
-                    'lon': city['lon'],
-                    'appid': api_key,
-                    'units': 'metric'
-                }
+                air_endpoint, weather_endpoint = self._openweather_endpoints(city, api_key)
                 
-                record = {
-                    'timestamp': get_vietnam_time_str(),
-                    'city': city['name'],
-                    'province': city['province'],
-                    'latitude': city['lat'],
-                    'longitude': city['lon'],
-                    'source': 'openweathermap'
-                }
-                
-                # Crawl air pollution data
-                try:
-                    air_response = self.session.get(air_url, params=air_params, timeout=30)
-                    if air_response.status_code == 200:
-                        air_data = air_response.json()
-                        if 'list' in air_data and air_data['list']:
-                            current = air_data['list'][0]
-                            main = current.get('main', {})
-                            components = current.get('components', {})
-                            record.update({
-                                'aqi': main.get('aqi'),
-                                'pm25': components.get('pm2_5'),
-                                'pm10': components.get('pm10'),
-                                'o3': components.get('o3'),
-                                'no2': components.get('no2'),
-                                'so2': components.get('so2'),
-                                'co': components.get('co'),
-                                'nh3': components.get('nh3'),
-                            })
-                    elif air_response.status_code == 401:
-                        logger.error(f"OpenWeatherMap API key invalid for {city['name']}")
-                        return None
-                    else:
-                        logger.debug(f"OpenWeatherMap air pollution API failed for {city['name']}: {air_response.status_code}")
-                except Exception as e:
-                    logger.debug(f"OpenWeatherMap air pollution error for {city['name']}: {str(e)}")
+                # Gửi đồng thời request air pollution và weather
+                air_future = endpoint_executor.submit(fetch_json, air_endpoint, 'air pollution', city)
+                weather_status, weather_data = fetch_json(weather_endpoint, 'weather', city)
+                air_status, air_data = air_future.result()
                 
-                # Crawl weather data
-                try:
-                    weather_response = self.session.get(weather_url, params=weather_params, timeout=30)
-                    if weather_response.status_code == 200:
-                        weather_data = weather_response.json()
-                        main_weather = weather_data.get('main', {})
-                        wind_weather = weather_data.get('wind', {})
-                        record.update({
-                            'temperature': main_weather.get('temp'),
-                            'humidity': main_weather.get('humidity'),
-                            'pressure': main_weather.get('pressure'),
-                            'wind_speed': wind_weather.get('speed'),
-                            'wind_direction': wind_weather.get('deg'),
-                            'visibility': weather_data.get('visibility'),
-                            'weather_condition': weather_data.get('weather', [{}])[0].get('main') if weather_data.get('weather') else None
-                        })
-                    else:
-                        logger.debug(f"OpenWeatherMap weather API failed for {city['name']}: {weather_response.status_code}")
-                except Exception as e:
-                    logger.debug(f"OpenWeatherMap weather error for {city['name']}: {str(e)}")
+                if air_status == 401:
+                    logger.error(f"OpenWeatherMap API key invalid for {city['name']}")
+                    return None
+                if 304 in (air_status, weather_status) and 200 not in (air_status, weather_status):
+                    # Không endpoint nào có số liệu mới: không phát lại bản ghi cũ
+                    logger.info(f"OpenWeatherMap readings for {city['name']} unchanged, skipping")
+                    return None
                 
-                # Chỉ trả về record nếu có ít nhất một số dữ liệu hữu ích
-                if any(record.get(key) is not None for key in ['aqi', 'pm25', 'pm10', 'temperature']):
+                record = self._build_openweather_record(city, air_data, weather_data)
+                if record:
                     logger.info(f"{SUCCESS_MARK} OpenWeatherMap data crawled for {city['name']}")
-                    return record
                 else:
                     logger.debug(f"{FAIL_MARK} No useful data from OpenWeatherMap for {city['name']}")
-                    return None
+                return record
                 
             except Exception as e:
                 logger.error(f"Error crawling OpenWeatherMap for {city['name']}: {str(e)}")
                 return None
         
-        # Crawl từng thành phố
-        for city in cities:
-            try:
-                result = crawl_city_openweather(city)
-                if result:
-                    data.append(result)
-                time.sleep(1)  # Rate limiting
-            except Exception as e:
-                logger.debug(f"Failed to crawl OpenWeatherMap for {city['name']}: {str(e)}")
-                continue
+        with ThreadPoolExecutor(max_workers=self.city_workers['openweathermap'],
+                                thread_name_prefix='openweathermap-endpoint') as endpoint_executor:
+            data = self._crawl_cities('openweathermap', crawl_city_openweather, cities)
         
         logger.info(f"OpenWeatherMap crawling completed. Retrieved {len(data)} records")
         return data
 
+    async def _async_cached_get(self, client: aiohttp.ClientSession, semaphore: asyncio.Semaphore, source: str, url: str,
+                                parse, fingerprint=None, params: Dict = None, headers: Dict = None, timeout: int = 30):
+        """Phiên bản bất đồng bộ của _cached_get, giới hạn thêm bởi semaphore của nguồn"""
+        limiter = RATE_LIMITERS[source]
+        # Cache nằm trên đĩa: đọc/ghi trong thread để không chặn event loop
+        key, entry, conditional = await asyncio.to_thread(self.http_cache.lookup, url, params)
+        async with semaphore:
+            await limiter.acquire_async()
+            async with client.get(url, params=params, headers={**(headers or {}), **conditional},
+                                  timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status == 429:
+                    self._back_off(source, limiter, response.headers.get('Retry-After'))
+                body = await response.read()
+        return await asyncio.to_thread(self.http_cache.resolve, key, entry, response.status, response.headers, body,
+                                       parse, fingerprint)
+
+    async def _crawl_iqair_city_async(self, client, semaphore, city: Dict, api_key: str) -> Optional[Dict]:
+        """Phiên bản bất đồng bộ của crawl_city trong crawl_iqair_data"""
+        names_to_try = [city['name']] + city.get('alt_names', [])
+        for name in names_to_try:
+            for endpoint in self._iqair_endpoints(city, name, api_key):
+                try:
+                    status, json_data = await self._async_cached_get(client, semaphore, 'iqair', endpoint['url'], json.loads,
+                                                                     IQAIR_STATION_TIME, params=endpoint['params'])
+                    if status == 200:
+                        if json_data.get('status') == 'success' and json_data.get('data'):
+                            record = self._build_iqair_record(city, json_data['data']['current'])
+                            logger.info(f"{SUCCESS_MARK} IQAir data crawled for {city['name']}")
+                            return record
+                    elif status == 304:
+                        logger.info(f"IQAir reading for {city['name']} unchanged, skipping")
+                        return None
+                    elif status == 429:
+                        continue
+                    elif status == 401:
+                        logger.error(f"IQAir API key invalid for {city['name']}. Check your API key.")
+                        return None
+                    else:
+                        logger.debug(f"IQAir request failed for {city['name']}. Status code: {status}")
+                except Exception as e:
+                    logger.debug(f"IQAir async error for {city['name']}: {str(e)}")
+        return None
+
+    async def _crawl_waqi_city_async(self, client, semaphore, city: Dict, token: str) -> Optional[Dict]:
+        """Phiên bản bất đồng bộ của crawl_city_with_retry trong crawl_waqi_data"""
+        for _ in range(WAQI_CITY_ATTEMPTS):
+            if token and token != 'demo':
+                for url in self._waqi_api_urls(city, token):
+                    try:
+                        status, data_json = await self._async_cached_get(client, semaphore, 'waqi', url, json.loads,
+                                                                         WAQI_STATION_TIME, timeout=20)
+                        if status == 304:
+                            logger.info(f"WAQI API reading for {city['name']} unchanged, skipping")
+                            return None
+                        if status == 200:
+                            record = self._build_waqi_api_record(city, data_json)
+                            if record:
+                                logger.info(f"{SUCCESS_MARK} WAQI API data crawled for {city['name']}")
+                                return record
+                    except Exception as e:
+                        logger.debug(f"WAQI API error for {city['name']}: {str(e)}")
+
+            for web_url in self._waqi_web_urls(city):
+                try:
+                    status, values = await self._async_cached_get(client, semaphore, 'waqi_web', web_url, self._extract_waqi_html,
+                                                                  headers=self._web_headers(), timeout=20)
+                    if status == 304:
+                        logger.info(f"WAQI web reading for {city['name']} unchanged, skipping")
+                        return None
+                    if status == 200 and values:
+                        record = self._build_waqi_web_record(city, values)
+                        logger.info(f"{SUCCESS_MARK} WAQI web data crawled for {city['name']}")
+                        return record
+                except Exception as e:
+                    logger.debug(f"WAQI web scraping error for {city['name']}: {str(e)}")
+        logger.debug(f"{FAIL_MARK} Could not crawl WAQI data for {city['name']}")
+        return None
+
+    async def _crawl_openweather_city_async(self, client, semaphore, city: Dict, api_key: str) -> Optional[Dict]:
+        """Gọi đồng thời air_pollution và weather của OpenWeatherMap cho một thành phố"""
+        async def fetch_json(endpoint: Dict):
+            try:
+                status, payload = await self._async_cached_get(client, semaphore, 'openweathermap', endpoint['url'], json.loads,
+                                                               endpoint['station_time'], params=endpoint['params'])
+            except Exception as e:
+                logger.debug(f"OpenWeatherMap error for {city['name']}: {str(e)}")
+                return None, None
+            if status == 401:
+                logger.error(f"OpenWeatherMap API key invalid for {city['name']}")
+            elif status not in (200, 304):
+                logger.debug(f"OpenWeatherMap request {endpoint['url']} failed for {city['name']}: {status}")
+            else:
+                return status, payload
+            return status, None
+
+        (air_status, air_data), (weather_status, weather_data) = await asyncio.gather(
+            *(fetch_json(endpoint) for endpoint in self._openweather_endpoints(city, api_key))
+        )
+        if 304 in (air_status, weather_status) and 200 not in (air_status, weather_status):
+            logger.info(f"OpenWeatherMap readings for {city['name']} unchanged, skipping")
+            return None
+        record = self._build_openweather_record(city, air_data, weather_data)
+        if record:
+            logger.info(f"{SUCCESS_MARK} OpenWeatherMap data crawled for {city['name']}")
+        else:
+            logger.debug(f"{FAIL_MARK} No useful data from OpenWeatherMap for {city['name']}")
+        return record
+
+    async def crawl_all_async(self, iqair_api_key: str = None, openweather_api_key: str = None,
+                              waqi_token: str = 'demo', cities_by_source: Dict[str, List[Dict]] = None) -> Dict[str, List[Dict]]:
+        """
+        Crawl đồng thời mọi (nguồn, thành phố) qua một aiohttp session dùng chung.
+        Mỗi nguồn có semaphore riêng theo self.city_workers.
+        cities_by_source giới hạn thành phố cần crawl của từng nguồn (None = tất cả).
+        Trả về dict tên nguồn -> danh sách bản ghi (giữ thứ tự thành phố).
+        """
+        jobs = {'WAQI': (self._crawl_waqi_city_async, 'waqi', waqi_token)}
+        if iqair_api_key and iqair_api_key.strip():
+            jobs['IQAir'] = (self._crawl_iqair_city_async, 'iqair', iqair_api_key)
+        if openweather_api_key and openweather_api_key.strip():
+            jobs['OpenWeatherMap'] = (self._crawl_openweather_city_async, 'openweathermap', openweather_api_key)
+        cities = {source: self._source_cities(source, cities_by_source) for _, source, _ in jobs.values()}
+        jobs = {source_name: job for source_name, job in jobs.items() if cities[job[1]]}
+
+        connector = aiohttp.TCPConnector(limit=sum(self.city_workers.values()))
+        async with aiohttp.ClientSession(headers=dict(self.session.headers), connector=connector) as client:
+            coroutines = []
+            for crawl_city, source, key in jobs.values():
+                semaphore = asyncio.Semaphore(self.city_workers[source])
+                coroutines.append(asyncio.gather(
+                    *(crawl_city(client, semaphore, city, key) for city in cities[source]),
+                    return_exceptions=True
+                ))
+            results = await asyncio.gather(*coroutines)
+
+        results_by_source = {}
+        for (source_name, (_, source, _)), records in zip(jobs.items(), results):
+            records = [record for record in records if isinstance(record, dict)]
+            self.freshness.update(source, cities[source], records)
+            results_by_source[source_name] = records
+        await asyncio.to_thread(self.freshness.save)
+        return results_by_source
+
+    async def run_async_crawl(self, iqair_api_key: str = None, openweather_api_key: str = None, waqi_token: str = 'demo',
+                              cities_by_source: Dict[str, List[Dict]] = None):
+        """Giống run_optimized_crawl nhưng crawl tất cả nguồn đồng thời bằng asyncio"""
+        logger.info("="*60)
+        logger.info("STARTING ASYNC AIR QUALITY CRAWL")
+        logger.info("="*60)
+
+        if not await asyncio.to_thread(self.check_connectivity):
+            logger.error("Crawl aborted due to network issues")
+            return {"success": False, "error": "Network connectivity issue"}
+
+        self.http_cache.reset_stats()
+        start_time = time.time()
+        results_by_source = await self.crawl_all_async(iqair_api_key, openweather_api_key, waqi_token, cities_by_source)
+        elapsed_time = time.time() - start_time
+
+        all_results = []
+        for source_name, results in results_by_source.items():
+            if results:
+                logger.info(f"✓ {source_name}: {len(results)} records")
+            else:
+                logger.warning(f"✗ {source_name}: No data retrieved")
+            all_results.extend(results)
+        logger.info(f"Async crawl finished in {elapsed_time:.1f}s")
+
+        return self._finalize_crawl(all_results)
+
     def merge_data(self, all_data: List[Dict]) -> List[Dict]:
         """Merge data từ các nguồn khác nhau"""
         merged = []
@@ -560,19 +1416,32 @@ class AirQualityCrawler:
             merged.append(record)
         return merged
 
-    def save_to_csv(self, data: List[Dict], filename: str = None) -> str:
-        if not data:
+    def build_export_frame(self, data: List[Dict]) -> pd.DataFrame:
+        """DataFrame export (kiểu số, thứ tự cột, bỏ raw_data) dùng chung cho file CSV và stream NDJSON"""
+        df = pd.DataFrame(data)
+        df = df.sort_values(['timestamp', 'city'], ascending=[False, True])
+        
+        for col in EXPORT_NUMERIC_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        
+        # Loại bỏ cột raw_data trước khi lưu
+        if 'raw_data' in df.columns:
+            df = df.drop('raw_data', axis=1)
+        
+        existing_columns = [col for col in EXPORT_COLUMN_ORDER if col in df.columns]
+        remaining_columns = [col for col in df.columns if col not in existing_columns]
+        final_columns = existing_columns + remaining_columns
+        return df[final_columns].reset_index(drop=True)
+
+    def save_to_csv(self, data, filename: str = None) -> str:
+        """Ghi bản ghi (list dict hoặc DataFrame từ build_export_frame) ra data_export, trả về đường dẫn file"""
+        if data is None or len(data) == 0:
             logger.warning("No data to save")
             return None
         
         # Sử dụng thư mục /app/data nếu tồn tại (khi chạy Docker), ngược lại dùng thư mục hiện tại
-        docker_data_dir = Path("/app/data")
-        if docker_data_dir.exists():
-            data_folder = docker_data_dir
-        else:
-            current_dir = Path(__file__).parent
-            data_folder = current_dir / 'data'
-        data_folder.mkdir(exist_ok=True)
+        data_folder = get_data_dir()
         
         current_date = datetime.now()
         date_folder = data_folder / 'data_export'
@@ -584,28 +1453,7 @@ class AirQualityCrawler:
         file_path = date_folder / filename
         
         try:
-            df = pd.DataFrame(data)
-            df = df.sort_values(['timestamp', 'city'], ascending=[False, True])
-            
-            numeric_columns = ['aqi', 'aqi_cn', 'pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'nh3',
-                            'temperature', 'humidity', 'pressure', 'wind_speed', 'wind_direction', 
-                            'visibility', 'uv_index', 'latitude', 'longitude']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-            # Loại bỏ cột raw_data trước khi lưu
-            if 'raw_data' in df.columns:
-                df = df.drop('raw_data', axis=1)
-            
-            column_order = ['timestamp', 'city', 'province', 'city_source', 'latitude', 'longitude', 
-                        'aqi', 'aqi_cn', 'pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'nh3',
-                        'temperature', 'humidity', 'pressure', 'wind_speed', 'wind_direction',
-                        'visibility', 'uv_index', 'weather_condition', 'source', 'status']
-            existing_columns = [col for col in column_order if col in df.columns]
-            remaining_columns = [col for col in df.columns if col not in existing_columns]
-            final_columns = existing_columns + remaining_columns
-            df = df[final_columns]
+            df = data if isinstance(data, pd.DataFrame) else self.build_export_frame(data)
             
             df.to_csv(file_path, index=False, encoding='utf-8-sig')
             logger.info(f"Data exported to {file_path} ({len(df)} records)")
@@ -622,8 +1470,65 @@ class AirQualityCrawler:
             logger.error(f"Error saving to CSV: {str(e)}")
             return None
 
-    def run_optimized_crawl(self, iqair_api_key: str = None, openweather_api_key: str = None, waqi_token: str = 'demo'):
-        """Chạy crawl tối ưu với xử lý lỗi tốt hơn và trả về cả đường dẫn file lẫn nội dung CSV"""
+    def save_to_parquet(self, df: pd.DataFrame, name: str) -> List[str]:
+        """
+        Ghi DataFrame export ra data_export_parquet/date=YYYY-MM-DD/<name>.parquet (partition theo
+        ngày của timestamp) với schema cố định: cột số float64, timestamp kiểu thời gian,
+        city/province/source dạng dictionary. Trả về danh sách file đã ghi.
+        """
+        if pa is None:
+            logger.error("pyarrow is not installed, cannot export Parquet")
+            return []
+        if df is None or df.empty:
+            logger.warning("No data to save")
+            return []
+
+        root = get_data_dir() / 'data_export_parquet'
+        schema = build_parquet_schema()
+        table_df = df.reindex(columns=schema.names)
+        for col in ('timestamp', 'observed_at'):
+            table_df[col] = pd.to_datetime(table_df[col], errors='coerce')
+        for col in EXPORT_NUMERIC_COLUMNS:
+            table_df[col] = table_df[col].astype(float)
+        for col in EXPORT_CATEGORY_COLUMNS:
+            table_df[col] = table_df[col].astype('category')
+
+        written = []
+        try:
+            for day, part in table_df.groupby(table_df['timestamp'].dt.strftime('%Y-%m-%d'), sort=False):
+                partition_dir = root / f"date={day}"
+                partition_dir.mkdir(parents=True, exist_ok=True)
+                file_path = partition_dir / f"{name}.parquet"
+                pq.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False), file_path)
+                written.append(str(file_path))
+            logger.info(f"Data exported to {root} as Parquet ({len(table_df)} records, {len(written)} partition(s))")
+        except Exception as e:
+            logger.error(f"Error saving to Parquet: {str(e)}")
+        return written
+
+    def _source_cities(self, source: str, cities_by_source: Dict[str, List[Dict]] = None) -> List[Dict]:
+        """Thành phố cần crawl cho nguồn: tất cả nếu không truyền cities_by_source"""
+        if cities_by_source is None:
+            return self.get_vietnam_cities()
+        return cities_by_source.get(source, [])
+
+    def plan_incremental_crawl(self, iqair_api_key: str = None, openweather_api_key: str = None,
+                               now: float = None) -> Dict[str, List[Dict]]:
+        """Các thành phố đã đến hạn cập nhật của từng nguồn đang bật (theo self.freshness)"""
+        sources = ['waqi']
+        if iqair_api_key and iqair_api_key.strip():
+            sources.append('iqair')
+        if openweather_api_key and openweather_api_key.strip():
+            sources.append('openweathermap')
+        cities = self.get_vietnam_cities()
+        return {source: self.freshness.due_cities(source, cities, now) for source in sources}
+
+    def run_optimized_crawl(self, iqair_api_key: str = None, openweather_api_key: str = None, waqi_token: str = 'demo',
+                            cities_by_source: Dict[str, List[Dict]] = None):
+        """
+        Chạy crawl tối ưu với xử lý lỗi tốt hơn và trả về cả đường dẫn file lẫn nội dung CSV.
+        cities_by_source giới hạn thành phố cần crawl của từng nguồn (None = tất cả).
+        """
         logger.info("="*60)
         logger.info("STARTING ENHANCED AIR QUALITY CRAWL")
         logger.info("="*60)
@@ -632,21 +1537,23 @@ class AirQualityCrawler:
             logger.error("Crawl aborted due to network issues")
             return {"success": False, "error": "Network connectivity issue"}
         
+        self.http_cache.reset_stats()
+        
         # Chuẩn bị danh sách các task crawling
         crawl_tasks = []
         
         # WAQI luôn chạy (có thể dùng demo token)
-        crawl_tasks.append(('WAQI', self.crawl_waqi_data, [waqi_token]))
+        crawl_tasks.append(('WAQI', 'waqi', self.crawl_waqi_data, waqi_token))
         
         # IQAir chỉ chạy nếu có API key
         if iqair_api_key and iqair_api_key.strip():
-            crawl_tasks.append(('IQAir', self.crawl_iqair_data, [iqair_api_key]))
+            crawl_tasks.append(('IQAir', 'iqair', self.crawl_iqair_data, iqair_api_key))
         else:
             logger.info("IQAir API key not provided, skipping IQAir crawling")
         
         # OpenWeatherMap chỉ chạy nếu có API key
         if openweather_api_key and openweather_api_key.strip():
-            crawl_tasks.append(('OpenWeatherMap', self.crawl_openweather_data, [openweather_api_key]))
+            crawl_tasks.append(('OpenWeatherMap', 'openweathermap', self.crawl_openweather_data, openweather_api_key))
         else:
             logger.info("OpenWeatherMap API key not provided, skipping OpenWeatherMap crawling")
         
@@ -656,49 +1563,56 @@ class AirQualityCrawler:
         
         all_results = []
         
-        # Chạy từng task crawling với retry logic
-        for source_name, crawl_func, args in crawl_tasks:
+        # Chạy từng task crawling; retry theo từng thành phố nằm trong các hàm crawl
+        for source_name, source, crawl_func, key in crawl_tasks:
+            cities = self._source_cities(source, cities_by_source)
+            if not cities:
+                logger.info(f"{source_name}: no stations due, skipping")
+                continue
             logger.info(f"Starting {source_name} crawling...")
             start_time = time.time()
             
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    results = crawl_func(*args)
-                    elapsed_time = time.time() - start_time
-                    
-                    if results:
-                        all_results.extend(results)
-                        logger.info(f"✓ {source_name}: {len(results)} records in {elapsed_time:.1f}s")
-                        break
-                    else:
-                        logger.warning(f"✗ {source_name}: No data retrieved in {elapsed_time:.1f}s")
-                        if attempt < max_retries - 1:
-                            time.sleep(2 ** attempt)  # Exponential backoff
-                        else:
-                            logger.error(f"✗ {source_name}: Failed after {max_retries} attempts")
-                except Exception as e:
-                    elapsed_time = time.time() - start_time
-                    logger.error(f"✗ {source_name} failed in {elapsed_time:.1f}s: {str(e)}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2 ** attempt)
-                    else:
-                        logger.error(f"✗ {source_name}: Failed after {max_retries} attempts: {str(e)}")
-            
-            # Delay giữa các nguồn
-            if source_name != crawl_tasks[-1][0]:
-                time.sleep(3)
+            results = []
+            try:
+                results = crawl_func(key, cities)
+                elapsed_time = time.time() - start_time
+                if results:
+                    all_results.extend(results)
+                    logger.info(f"✓ {source_name}: {len(results)} records in {elapsed_time:.1f}s")
+                else:
+                    logger.warning(f"✗ {source_name}: No data retrieved in {elapsed_time:.1f}s")
+            except Exception as e:
+                elapsed_time = time.time() - start_time
+                logger.error(f"✗ {source_name} failed in {elapsed_time:.1f}s: {str(e)}")
+            self.freshness.update(source, cities, results or [])
+        self.freshness.save()
         
-        # Xử lý kết quả
+        return self._finalize_crawl(all_results)
+
+    def _finalize_crawl(self, all_results: List[Dict]) -> Dict:
+        """Gộp, lưu CSV và tạo dict kết quả trả về cho n8n"""
+        cache_stats = self.http_cache.stats()
+        logger.info(f"HTTP cache: {cache_stats['hits']} unchanged readings skipped "
+                    f"({cache_stats['not_modified']} not modified), {cache_stats['misses']} new")
         if all_results:
             all_results = self.merge_data(all_results)
-            csv_file = self.save_to_csv(all_results)
-            if not csv_file:
-                logger.error("Failed to save CSV file")
-                return {"success": False, "error": "Failed to save CSV file"}
+            df = self.build_export_frame(all_results)
+            # batch_id trùng tên file export để /crawl_batches vẫn đọc được khi batch đã rời bộ nhớ
+            batch_id = f"air_quality_vietnam_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            csv_file = None
+            if EXPORT_FORMAT in ('csv', 'both'):
+                csv_file = self.save_to_csv(df, f"{batch_id}.csv")
+                if not csv_file:
+                    logger.error("Failed to save CSV file")
+                    return {"success": False, "error": "Failed to save CSV file", 'http_cache': cache_stats}
+            parquet_files = []
+            if EXPORT_FORMAT in ('parquet', 'both'):
+                parquet_files = self.save_to_parquet(df, batch_id)
+                if not parquet_files:
+                    logger.error("Failed to save Parquet file")
+                    return {"success": False, "error": "Failed to save Parquet file", 'http_cache': cache_stats}
             
-            df = pd.DataFrame(all_results)
-            csv_content = df.to_csv(index=False, encoding='utf-8-sig')
+            CRAWL_BATCHES.put(batch_id, df)
             cities_covered = len(df['city'].unique())
             sources = df['source'].value_counts().to_dict()
             
@@ -708,18 +1622,26 @@ class AirQualityCrawler:
             logger.info(f"Total records: {len(all_results)}")
             logger.info(f"Cities covered: {cities_covered}")
             logger.info(f"CSV file: {csv_file}")
+            if parquet_files:
+                logger.info(f"Parquet files: {', '.join(parquet_files)}")
             logger.info("Sources breakdown:")
             for source, count in sources.items():
                 logger.info(f"  {source}: {count} records")
             
-            return {
+            result = {
                 'csv_file': csv_file,
-                'csv_content': csv_content,
+                'parquet_files': parquet_files,
+                'batch_id': batch_id,
+                'batch_url': f"/crawl_batches/{batch_id}",
                 'total_records': len(all_results),
                 'cities_covered': cities_covered,
                 'sources': sources,
+                'http_cache': cache_stats,
                 'success': True
             }
+            if self.include_csv_content:
+                result['csv_content'] = df.to_csv(index=False, encoding='utf-8-sig')
+            return result
         else:
             logger.error("="*60)
             logger.error("CRAWL FAILED - NO DATA COLLECTED")
@@ -731,21 +1653,148 @@ class AirQualityCrawler:
             logger.error("- Target websites are down")
             return {
                 'success': False,
-                'error': 'No data was successfully crawled from any source'
+                'error': 'No data was successfully crawled from any source',
+                'http_cache': cache_stats
             }
+
+class CrawlRun:
+    """Một lượt crawl chạy nền: trạng thái, thời gian và kết quả trả về cho /crawl_runs"""
+
+    def __init__(self, crawl_mode: str, include_csv_content: bool, request_key: str = None):
+        self.run_id = uuid.uuid4().hex
+        # Băm của tham số lượt crawl (API key, phạm vi nguồn/thành phố), để trigger giống hệt dùng lại lượt này
+        self.request_key = request_key
+        self.crawl_mode = crawl_mode
+        self.include_csv_content = include_csv_content
+        self.status = 'queued'
+        self.created_at = get_vietnam_time_str()
+        self.started_at = None
+        self.finished_at = None
+        self.duration = None
+        self.result = None
+        self.error = None
+        self.future = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'run_id': self.run_id,
+            'status': self.status,
+            'crawl_mode': self.crawl_mode,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration_seconds': self.duration,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class CrawlRunManager:
+    """
+    Chạy các lượt crawl lần lượt trên một thread nền với một AirQualityCrawler dùng chung, nên
+    session, connection pool, cache HTTP và trạng thái trạm được giữ giữa các lượt. Trigger có
+    cùng tham số (API key, phạm vi nguồn/thành phố, chế độ) với một lượt đang chờ/chạy sẽ nhận
+    lại lượt đó thay vì crawl trùng; trigger khác (ví dụ crawl đầy đủ khi lượt incremental của
+    scheduler đang chạy) được xếp thành một lượt sau đó.
+    """
+
+    def __init__(self, max_runs: int):
+        self.max_runs = max(1, max_runs)
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._crawler = None
+
+    @property
+    def crawler(self) -> AirQualityCrawler:
+        with self._lock:
+            if self._crawler is None:
+                self._crawler = AirQualityCrawler()
+            return self._crawler
+
+    def submit(self, iqair_api_key: str = None, openweather_api_key: str = None, waqi_token: str = 'demo',
+               crawl_mode: str = CRAWL_MODE, include_csv_content: bool = INCLUDE_CSV_CONTENT,
+               cities_by_source: Dict[str, List[Dict]] = None):
+        """
+        Xếp một lượt crawl vào hàng đợi; trả về (lượt crawl, True nếu vừa tạo mới). Một lượt
+        chờ/chạy với cùng tham số được dùng lại, nên mỗi loại trigger có nhiều nhất một lượt xếp hàng.
+        """
+        request_key = hashlib.sha1(json.dumps(
+            [iqair_api_key, openweather_api_key, waqi_token, crawl_mode, bool(include_csv_content), cities_by_source],
+            sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        with self._lock:
+            for pending in self._runs.values():
+                if pending.request_key == request_key and not pending.future.done():
+                    return pending, False
+            run = CrawlRun(crawl_mode, include_csv_content, request_key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='crawl-run')
+            run.future = self._executor.submit(self._run, run, iqair_api_key, openweather_api_key, waqi_token,
+                                               cities_by_source)
+            self._runs[run.run_id] = run
+            # Chỉ bỏ lượt đã xong, lượt cũ nhất trước
+            finished = [run_id for run_id, old in self._runs.items() if old.future.done()]
+            for run_id in finished[:max(0, len(self._runs) - self.max_runs)]:
+                del self._runs[run_id]
+            return run, True
+
+    def get(self, run_id: str) -> Optional[CrawlRun]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def _run(self, run: CrawlRun, iqair_api_key, openweather_api_key, waqi_token, cities_by_source):
+        run.status = 'running'
+        run.started_at = get_vietnam_time_str()
+        start_time = time.perf_counter()
+        try:
+            crawler = self.crawler
+            crawler.include_csv_content = run.include_csv_content
+            if run.crawl_mode == 'async':
+                result = asyncio.run(crawler.run_async_crawl(iqair_api_key, openweather_api_key, waqi_token,
+                                                             cities_by_source))
+            else:
+                result = crawler.run_optimized_crawl(iqair_api_key, openweather_api_key, waqi_token, cities_by_source)
+            run.result = result
+            if result and result.get('success'):
+                run.status = 'succeeded'
+            else:
+                run.status = 'failed'
+                run.error = result.get('error', 'Unknown error') if result else 'Unknown error'
+        except Exception as e:
+            logger.error(f"Crawl run {run.run_id} failed: {str(e)}")
+            run.status = 'failed'
+            run.error = str(e)
+        finally:
+            run.duration = round(time.perf_counter() - start_time, 3)
+            run.finished_at = get_vietnam_time_str()
+
+
+CRAWL_RUNS = CrawlRunManager(CRAWL_RUN_RETENTION)
+
 ENABLE_SCHEDULING = True 
 def main():
     """Hàm main với schedule và xử lý lỗi"""
-    def job():
+    def job(incremental: bool = False):
         try:
-            # Khởi tạo crawler
-            crawler = AirQualityCrawler()
+            # Crawler dùng chung với các lượt crawl qua API
+            crawler = CRAWL_RUNS.crawler
             
             # Đọc API keys
             iqair_api_key = None
             openweather_api_key = os.getenv('OPENWEATHER_API_KEY') 
             waqi_token = os.getenv('WAQI_TOKEN', 'demo')
             
+            # Chế độ incremental: chỉ crawl các trạm đã đến hạn cập nhật
+            cities_by_source = None
+            if incremental:
+                cities_by_source = crawler.plan_incremental_crawl(iqair_api_key, openweather_api_key)
+                due_count = sum(len(cities) for cities in cities_by_source.values())
+                if not due_count:
+                    logger.debug("No stations due for refresh")
+                    return
+                logger.info(f"{due_count} station(s) due for refresh: " +
+                            ", ".join(f"{source}={len(cities)}" for source, cities in cities_by_source.items()))
+            
             # Log thông tin API keys
             logger.info("Starting scheduled crawl...")
             logger.info("API Keys Status:")
@@ -753,8 +1802,11 @@ def main():
             logger.info(f"  OpenWeatherMap API: {'✓ Available' if openweather_api_key else '✗ Not provided'}")
             logger.info(f"  WAQI Token: {'✓ Custom token' if waqi_token != 'demo' else '✗ Using demo token'}")
             
-            # Chạy crawl
-            result = crawler.run_optimized_crawl(iqair_api_key, openweather_api_key, waqi_token)
+            # Chạy crawl trên thread của CRAWL_RUNS (không chồng lên lượt đang chạy) và chờ kết quả
+            run, _ = CRAWL_RUNS.submit(iqair_api_key, openweather_api_key, waqi_token,
+                                       cities_by_source=cities_by_source)
+            run.future.result()
+            result = run.result
             
             # Log kết quả
             if result and result.get('success'):
@@ -779,12 +1831,17 @@ def main():
         except ImportError:
             logger.info("python-dotenv not installed, reading environment variables directly")
         if ENABLE_SCHEDULING:
-            # Schedule job để chạy mỗi giờ
-            schedule.every().hour.at(":00").do(job)
+            incremental = CRAWL_SCHEDULE == 'incremental'
+            if incremental:
+                # Mỗi phút kiểm tra trạm nào đã đến hạn, request được rải đều trong giờ
+                schedule.every().minute.do(job, incremental=True)
+            else:
+                # Schedule job để chạy mỗi giờ
+                schedule.every().hour.at(":00").do(job)
             
             # Chạy job ngay lập tức lần đầu
             logger.info("Running first crawl...")
-            job()
+            job(incremental=incremental)
             
             # Keep the script running
             logger.info("Starting scheduler, waiting for next run...")
@@ -814,6 +1871,8 @@ def simple_run():
     logger.info(f"  OpenWeatherMap API: {'✓ Available' if openweather_api_key else '✗ Not provided'}")
     logger.info(f"  WAQI Token: {'✓ Custom token' if waqi_token != 'demo' else '✗ Using demo token'}")
     
+    if CRAWL_MODE == 'async':
+        return asyncio.run(crawler.run_async_crawl(iqair_api_key, openweather_api_key, waqi_token))
     return crawler.run_optimized_crawl(iqair_api_key, openweather_api_key, waqi_token)
     
 if __name__ == "__main__":